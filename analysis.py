@@ -0,0 +1,62 @@
+"""
+Engine analysis in a background thread, so the Streamlit rerun never waits for the search.
+Every finished iteration is published as the latest result for the position being analysed.
+The search shares the server process and its GIL with every session's reruns, so it is kept short.
+"""
+import threading
+
+from core import Position
+from engine import Engine, MAX_PLY
+
+
+class BackgroundAnalysis:
+    def __init__(self, time_limit=10.0, max_depth=MAX_PLY, tt_size_mb=8):
+        self.engine = Engine(tt_size_mb)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.key = None
+        self.result = None
+        self.finished = False
+        self._thread = None
+        self._stop = None
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def analyse(self, position: Position):
+        """ Start analysing position, unless it is the one already being analysed """
+        if position.hash == self.key: return
+        self.cancel()
+
+        self.key = position.hash
+        self._stop = threading.Event()
+        # The cancelled search may still be unwinding, the new thread waits for it since both use the same engine
+        self._thread = threading.Thread(target=self._run, args=(position.copy(), self.key, self._stop, self._previous), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        # Stale work stops within a few hundred nodes, without waiting for it here, this runs in click handlers
+        if self._thread is not None:
+            self._stop.set()
+            self._previous = self._thread
+        with self._lock:
+            self._thread = None
+            self.key = None
+            self.result = None
+            self.finished = False
+
+    def snapshot(self):
+        """ (result, finished) for the current position, result is None until depth 1 completes """
+        with self._lock:
+            return self.result, self.finished
+
+    def _run(self, position, key, stop, previous):
+        if previous is not None: previous.join()
+        if stop.is_set(): return
+
+        def publish(result):
+            with self._lock:
+                if self.key == key: self.result = result
+
+        self.engine.search(position, time_limit=self.time_limit, max_depth=self.max_depth, on_iteration=publish, stop_event=stop)
+        with self._lock:
+            if self.key == key: self.finished = True
@@ -0,0 +1,169 @@
+"""
+Static evaluation of many positions at once with NumPy. A batch is either an (N, 12) array of
+piece bitboards (uint64, in core.py piece code order) or (N, 12, 64) piece planes; planes are
+packed into bitboards first and every term works on whole columns of bitboards.
+Material and piece-square values are the engine's own tables, so with the extra terms switched
+off the result equals engine.evaluate; mobility and pawn structure are added on top.
+"""
+import numpy as np
+
+from core import Position, WHITE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, FILE_A, NOT_A, NOT_AB, NOT_H, NOT_GH
+from engine import PIECE_VALUES, PIECE_SQUARE, KING_ENDGAME_SQUARE, ENDGAME_MATERIAL
+
+# Centipawns per square a piece can move to
+MOBILITY_WEIGHTS = {KNIGHT: 4, BISHOP: 5, ROOK: 2, QUEEN: 1}
+DOUBLED_PAWN = -15
+ISOLATED_PAWN = -12
+# Passed pawn bonus by rank from the pawn's own side, the last rank never holds a pawn
+PASSED_PAWN = (0, 10, 15, 25, 40, 60, 90, 0)
+
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+# Squares a shift by so many files may land on without wrapping around the board
+FILE_MASKS = {-2: NOT_GH, -1: NOT_H, 0: (1 << 64) - 1, 1: NOT_A, 2: NOT_AB}
+
+FILES = np.array([FILE_A << y for y in range(8)], dtype=np.uint64)
+RANKS = np.array([0xFF << 8 * x for x in range(8)], dtype=np.uint64)
+BYTE_SHIFTS = np.arange(0, 64, 8, dtype=np.uint64)
+
+
+def _byte_table(square_values):
+    # Sum of the square values of every set bit, per byte of the bitboard and byte value
+    values = np.asarray(square_values, dtype=np.int32).reshape(8, 8)
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1  # (256, 8)
+    return values @ bits.T  # (8 bytes, 256)
+
+SQUARE_BYTES = np.stack([_byte_table(values) for values in PIECE_SQUARE])  # (12, 8, 256), positive for white
+KING_ENDGAME_BYTES = np.stack([_byte_table(values) for values in KING_ENDGAME_SQUARE])  # (2, 8, 256)
+
+
+def encode_positions(positions):
+    """ (bitboards (N, 12) uint64, side to move (N,)) of core.Position objects """
+    bitboards = np.array([position.pieces for position in positions], dtype=np.uint64).reshape(-1, 12)
+    turns = np.array([position.turn for position in positions], dtype=np.int8)
+    return bitboards, turns
+
+def to_bitboards(boards):
+    """ (N, 12) uint64 bitboards, (N, 12, 64) planes are packed """
+    boards = np.asarray(boards)
+    if boards.ndim == 2: return boards.astype(np.uint64, copy=False)
+    return np.bitwise_or.reduce(boards.astype(np.uint64) << np.arange(64, dtype=np.uint64), axis=2)
+
+def _shift(bitboards, dx, dy):
+    # Move every bit dx ranks up and dy files right, bits leaving the board are dropped
+    step = 8 * dx + dy
+    shifted = bitboards << np.uint64(step) if step > 0 else bitboards >> np.uint64(-step)
+    return shifted & np.uint64(FILE_MASKS[dy])
+
+def _popcount(bitboards):
+    return np.bitwise_count(bitboards).astype(np.int32)
+
+def _square_sum(bitboards, table):
+    # Look the bitboard up one byte at a time
+    data = (bitboards[:, None] >> BYTE_SHIFTS & np.uint64(0xFF)).astype(np.intp)  # (N, 8)
+    return table[np.arange(8), data].sum(axis=1)
+
+def material_and_squares(bitboards):
+    """ Material plus piece-square values for white, the kings switch tables like the engine does """
+    score = np.zeros(len(bitboards), dtype=np.int32)
+    non_pawn = np.zeros(len(bitboards), dtype=np.int32)
+    for code in range(12):
+        kind = code % 6
+        if kind == KING: continue
+        score += _square_sum(bitboards[:, code], SQUARE_BYTES[code])
+        if kind != PAWN: non_pawn += PIECE_VALUES[kind] * _popcount(bitboards[:, code])
+
+    endgame = non_pawn <= ENDGAME_MATERIAL
+    for code, color in ((KING, 0), (6 + KING, 1)):
+        middlegame_king = _square_sum(bitboards[:, code], SQUARE_BYTES[code])
+        endgame_king = _square_sum(bitboards[:, code], KING_ENDGAME_BYTES[color])
+        score += np.where(endgame, endgame_king, middlegame_king)
+    return score
+
+def _single_pieces(pieces):
+    # Split a bitboard into its lowest piece, the next one and the rest, so most moves are counted per piece
+    first = pieces & (~pieces + np.uint64(1))
+    rest = pieces ^ first
+    second = rest & (~rest + np.uint64(1))
+    return first, second, rest ^ second
+
+def mobility(bitboards):
+    """ Weighted pseudo-legal move counts of knights and sliders, white minus black """
+    own = [np.bitwise_or.reduce(bitboards[:, :6], axis=1), np.bitwise_or.reduce(bitboards[:, 6:], axis=1)]
+    empty = ~(own[0] | own[1])
+    score = np.zeros(len(bitboards), dtype=np.int32)
+
+    for color, sign in ((0, 1), (1, -1)):
+        base = color * 6
+        not_own = ~own[color]
+        for kind, weight in MOBILITY_WEIGHTS.items():
+            moves = np.zeros(len(bitboards), dtype=np.int32)
+            # Pieces beyond the second (promotions) share one attack set
+            for pieces in _single_pieces(bitboards[:, base + kind]):
+                targets = np.zeros(len(bitboards), dtype=np.uint64)
+                if kind == KNIGHT:
+                    for dx, dy in KNIGHT_STEPS: targets |= _shift(pieces, dx, dy)
+                else:
+                    directions = {BISHOP: BISHOP_DIRECTIONS, ROOK: ROOK_DIRECTIONS, QUEEN: ROOK_DIRECTIONS + BISHOP_DIRECTIONS}[kind]
+                    for dx, dy in directions:
+                        # Walk the ray one step at a time, only empty squares let it continue
+                        ray = pieces
+                        for _ in range(7):
+                            ray = _shift(ray, dx, dy)
+                            targets |= ray
+                            ray &= empty
+                moves += _popcount(targets & not_own)
+            score += sign * weight * moves
+    return score
+
+def pawn_structure(bitboards):
+    """ Doubled, isolated and passed pawn terms, white minus black """
+    score = np.zeros(len(bitboards), dtype=np.int32)
+    for code, enemy_code, sign, forward in ((PAWN, 6 + PAWN, 1, 1), (6 + PAWN, PAWN, -1, -1)):
+        pawns, enemy = bitboards[:, code], bitboards[:, enemy_code]
+        files = np.stack([_popcount(pawns & file) for file in FILES], axis=1)  # (N, 8)
+        score += sign * DOUBLED_PAWN * np.clip(files - 1, 0, None).sum(axis=1)
+        padded = np.pad(files, ((0, 0), (1, 1)))
+        score += sign * ISOLATED_PAWN * (files * ((padded[:, :-2] + padded[:, 2:]) == 0)).sum(axis=1)
+
+        # Squares behind enemy pawns and their neighbouring files, a pawn standing on one is not passed
+        span = _shift(enemy, 0, 1) | _shift(enemy, 0, -1) | enemy
+        span = _shift(span, -forward, 0)
+        for step in (8, 16, 32):
+            span |= span >> np.uint64(step) if forward > 0 else span << np.uint64(step)
+        passed = pawns & ~span
+        for x in range(1, 7):
+            bonus = PASSED_PAWN[x if forward > 0 else 7 - x]
+            score += sign * bonus * _popcount(passed & RANKS[x])
+    return score
+
+def evaluate_batch(boards, turns=None, with_mobility=True, with_pawns=True):
+    """
+    Centipawn scores of a batch, for white or, when turns (N,) is given, for the side to move
+    like engine.evaluate
+    """
+    bitboards = to_bitboards(boards)
+    score = material_and_squares(bitboards)
+    if with_mobility: score += mobility(bitboards)
+    if with_pawns: score += pawn_structure(bitboards)
+    if turns is None: return score
+    return np.where(np.asarray(turns) == WHITE, score, -score)
+
+def evaluate_positions(positions, **terms):
+    """ Side to move scores of core.Position objects """
+    bitboards, turns = encode_positions(positions)
+    return evaluate_batch(bitboards, turns, **terms)
+
+def score_moves(position: Position, moves=None, **terms):
+    """ (move, score) of every legal move for the side playing it, best first, one batch for all of them """
+    if moves is None: moves = position.legal_moves()
+    children = []
+    for move in moves:
+        position.make_move(move)
+        children.append(position.pieces[:])
+        position.unmake_move()
+    if not children: return []
+    turns = np.full(len(children), 1 - position.turn, dtype=np.int8)
+    scores = -evaluate_batch(np.array(children, dtype=np.uint64), turns, **terms)
+    return sorted(zip(moves, scores.tolist()), key=lambda entry: -entry[1])
@@ -1,9 +1,44 @@
+import os
+
 from pieces import Pawn, Rook, Knight, Bishop, Queen, King
+from history import GameHistory
+from position_cache import PositionCache
+import profiling
+from core import Position, COLORS, CHECKMATE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, square, piece_color, piece_type, move_from, move_to, move_promotion
 import streamlit as st
+import streamlit.components.v1 as components
+
+# Limits of the analysis cache shared by every session
+ANALYSIS_CACHE_ENTRIES = 50_000
+ANALYSIS_CACHE_BYTES = 64 << 20
+
+@st.cache_resource
+def get_analysis_cache(max_entries=ANALYSIS_CACHE_ENTRIES, max_bytes=ANALYSIS_CACHE_BYTES):
+    return PositionCache(max_entries, max_bytes)
+
+# One SVG board instead of 64 buttons, reports a single from/to selection
+board_component = components.declare_component("chess_board", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "board_component"))
 
 class Board:
-    def __init__(self):
-        self.board = self.create_board()
+    def __init__(self, position: Position = None):
+        # Only the position and its history are kept between reruns, the cells are rebuilt by render
+        self.position = position if position is not None else Position()
+        self.history = GameHistory(self.position)
+        self.update_status()
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(Position(fen))
+
+    def to_fen(self):
+        return self.position.to_fen()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(Position.from_bytes(data))
+
+    def to_bytes(self):
+        return self.position.to_bytes()
     
     def create_board(self):
         grid = []
@@ -17,66 +52,126 @@ class Board:
         return grid
     
     def get_piece(self, x, y):
-        if x in [0, 1]: color = "white"
-        elif x in [6, 7]: color = "black"
-
-        if x in [1, 6]: return Pawn(color, y)
-        elif x in [0, 7]:
-            if y == 0 or y == 7: return Rook(color, y)
-            if y == 1 or y == 6: return Knight(color, y)
-            if y == 2 or y == 5: return Bishop(color, y)
-            if y == 3: return Queen(color, y)
-            if y == 4: return King(color)
-
+        code = self.position.piece_at(square(x, y))
+        if code is None: return None
+
+        color = COLORS[piece_color(code)]
+        kind = piece_type(code)
+        if kind == PAWN: return Pawn(color, y)
+        if kind == ROOK: return Rook(color, y)
+        if kind == KNIGHT: return Knight(color, y)
+        if kind == BISHOP: return Bishop(color, y)
+        if kind == QUEEN: return Queen(color, y)
+        if kind == KING: return King(color)
+
+    def update_status(self):
+        # Once per move, repetition and the fifty-move rule depend on the game, not only on the position
+        self.status = self.position.status(self.analyse().moves)
+        profiling.count("status")
+
+    @property
+    def winner(self):
+        return COLORS[1 - self.position.turn] if self.status == CHECKMATE else None
+
+    @property
+    def hash(self):
+        # Zobrist key of the current position
+        return self.position.hash
+
+    def analyse(self):
+        # Sessions on the same position share one analysis
+        return get_analysis_cache().get_or_compute(self.position.hash, lambda: PositionAnalysis(self))
+
+    @profiling.timed("render_ms")
     def render(self):
+        # Analyse the position once, every cell reads from it
+        self.analysis = self.analyse()
+
         streamlit_columns = st.columns(8)
-        for rank in self.board:
+        for rank in self.create_board():
             for cell in rank:
                 with streamlit_columns[cell.y]:
                     cell.render(self)
     
-    def is_king_in_check(self, color):
-        # Get king position
-        king_position = self.find_king_position(color)
-        
-        # Check if any piece of opposite color can attack the king
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j].piece
-                if piece and piece.color != color:
-                    if king_position in piece.get_moves(self.board, i, j):
-                        st.session_state[f"{color}_king_in_check"] = True
-                        return True
-        st.session_state[f"{color}_king_in_check"] = False
-        return False
-
-    def find_king_position(self, color):
-        # Find king position
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j].piece
-                if isinstance(piece, King) and piece.color == color:
-                    return (i, j)
-        return None
-
-    def is_move_legal_in_check(self, start_pos, end_pos, color):
-        # Position backup
-        piece_backup = self.board[end_pos[0]][end_pos[1]].piece
-        moving_piece = self.board[start_pos[0]][start_pos[1]].piece
-
-        # Simulate move
-        self.board[end_pos[0]][end_pos[1]].piece = moving_piece
-        self.board[start_pos[0]][start_pos[1]].piece = None
-
-        # Check if king is in check after move
-        in_check_after_move = self.is_king_in_check(color)
-
-        # Revert move
-        self.board[start_pos[0]][start_pos[1]].piece = moving_piece
-        self.board[end_pos[0]][end_pos[1]].piece = piece_backup
-
-        # Return if king is not in check after move
-        return not in_check_after_move
+    @profiling.timed("render_ms")
+    def render_component(self, key="board", interactive=True):
+        """
+        Draw the board as one component, the browser highlights targets from the move map.
+        Returns True when the selection made a move, a board that is not interactive only shows the position
+        """
+        if interactive: self.analysis = self.analyse()
+        icons = [piece.icon if piece else "" for piece in (self.get_piece(x, y) for x in range(8) for y in range(8))]
+        in_check = self.analysis.in_check if interactive else self.position.is_check()
+        if not interactive: profiling.count("is_check")
+        check = self.position.king_square(self.position.turn) if in_check else None
+
+        profiling.count("widgets")
+        selection = board_component(icons=icons, moves=self.analysis.move_map if interactive and self.status is None else {}, check=check, hash=str(self.position.hash), key=key, default=None)
+
+        # The last selection is sent again on every rerun, apply it once and only to its own position
+        if not selection or selection["hash"] != str(self.position.hash) or selection["id"] == st.session_state.get("handled_selection"): return False
+        st.session_state.handled_selection = selection["id"]
+        return self.move_piece(divmod(selection["from"], 8), divmod(selection["to"], 8))
+
+    def move_piece(self, start_pos, end_pos):
+        # Pick the legal move between the two cells, pawns always promote to a queen
+        candidates = [move for move in self.analyse().moves if move_from(move) == square(*start_pos) and move_to(move) == square(*end_pos)]
+        if not candidates or self.status is not None: return False
+        move = max(candidates, key=lambda move: move_promotion(move) == QUEEN)
+
+        self.make_move(move)
+        return True
+
+    def make_move(self, move):
+        self.position.make_move(move)
+        self.history.push(move, self.position)
+        self.update_status()
+
+    def play_engine_move(self, engine, time_limit, **options):
+        result = engine.search(self.position, time_limit=time_limit, **options)
+        profiling.count("engine_nodes", result.nodes)
+        if result.best_move is not None: self.make_move(result.best_move)
+        return result
+
+    def take_back(self):
+        if not self.history: return False
+        self.position.unmake_move()
+        self.history.pop()
+        self.update_status()
+        return True
+
+    def rewind(self, ply):
+        # Continue the game from an earlier ply, the later moves are dropped
+        while len(self.history) > ply: self.take_back()
+
+class PositionAnalysis:
+    def __init__(self, board: Board):
+        """
+        Snapshot of the side to move: check status, legal moves per square and pieces
+        that can move. Shared between sessions, so read only, the game status lives on Board
+        """
+        # Cache misses, positions that actually ran move generation for the UI
+        profiling.count("positions_analysed")
+        position = board.position
+        self.color = COLORS[position.turn]
+        self.in_check = position.is_check()
+        profiling.count("is_check")
+
+        # Legal moves of every piece of the side to move
+        self.moves = tuple(position.legal_moves())
+        profiling.count("legal_moves")
+        self.legal_moves = {}
+        self.move_map = {}  # from square -> target squares, for the component board
+        for move in self.moves:
+            targets = self.move_map.setdefault(move_from(move), [])
+            if move_to(move) not in targets: targets.append(move_to(move))
+            start, end = divmod(move_from(move), 8), divmod(move_to(move), 8)
+            moves = self.legal_moves.setdefault(start, [])
+            if end not in moves: moves.append(end)
+        self.legal_moves = {start: tuple(moves) for start, moves in self.legal_moves.items()}
+        self.move_map = {start: tuple(targets) for start, targets in self.move_map.items()}
+
+        self.pieces_can_move = tuple(self.legal_moves)
 
 class BoardCell:
     def __init__(self, x, y, piece = None):
@@ -91,11 +186,9 @@ class BoardCell:
         self.disabled = True
         self.help = None
 
-    def has_legal_moves(self, board):
-        if self.piece: return self.piece.get_moves(board, self.x, self.y)
-        else: return False
-
     def render(self, board):
+            profiling.count("widgets")
+
             # Is cell active?
             is_active = (self.x, self.y) == st.session_state.get('active_piece', (None, None))
             is_any_active = st.session_state.get('active_piece') is not None
@@ -103,27 +196,27 @@ class BoardCell:
             # Has cell legal moves?
             is_legal_move = (self.x, self.y) in st.session_state.get('legal_moves', [])
 
-            # Is it white's turn?
-            is_whites_turn = st.session_state.get('whites_turn')
+            # Nothing moves once the game is over
+            if board.status is not None:
+                return st.button(self.piece.icon if self.piece else "‎ ‎ ‎ ‎ ‎ ‎", key=self.key, disabled=True)
 
             # Is king in check?
-            is_king_in_check = board.is_king_in_check(self.piece.color if self.piece else None)
+            analysis = board.analysis
+            is_king_in_check = analysis.in_check
+            is_own_piece = self.piece is not None and self.piece.color == analysis.color
 
             # Enable button if cell has legal moves and there is no any other active cell, or if this cell is active
-            if is_king_in_check and self.piece and ((self.piece.color == "white" and is_whites_turn) or (self.piece.color == "black" and not is_whites_turn)):
-                legal_moves_in_check = [move for move in self.piece.get_moves(board.board, self.x, self.y) if board.is_move_legal_in_check((self.x, self.y), move, self.piece.color)]
-                is_disabled = not legal_moves_in_check
-                if not is_disabled: st.session_state.pieces_can_move.append((self.x, self.y))
-                return st.button(self.piece.icon, key=self.key, disabled=is_disabled, help=self.help, on_click=self.handle_click, args=(self.x, self.y, board, legal_moves_in_check))
+            if is_king_in_check and is_own_piece:
+                is_disabled = (self.x, self.y) not in analysis.legal_moves
+                return st.button(self.piece.icon, key=self.key, disabled=is_disabled, help=self.help, on_click=self.handle_click, args=(self.x, self.y, board))
 
             if is_legal_move:
                 # If cell has legal moves, enable button
                 try: return st.button(self.piece.icon, key=self.key, disabled=False, help=self.help, on_click=self.move_piece, args=(self.x, self.y, board))
                 except: return st.button("‎ ‎ ‎ ‎ ‎ ‎", key=self.key, disabled=False, help=self.help, on_click=self.move_piece, args=(self.x, self.y, board))
-            elif self.piece and ((self.piece.color == "white" and is_whites_turn) or (self.piece.color == "black" and not is_whites_turn)):
-                has_legal_moves = self.has_legal_moves(st.session_state.game.board)
+            elif is_own_piece:
+                has_legal_moves = (self.x, self.y) in analysis.legal_moves
                 is_disabled = not (has_legal_moves and not is_any_active) and not is_active
-                if not is_disabled: st.session_state.pieces_can_move.append((self.x, self.y))
                 return st.button(self.piece.icon, key=self.key, disabled=is_disabled, help=self.help, on_click=self.handle_click, args=(self.x, self.y, board))
             elif self.piece:
                 return st.button(self.piece.icon, key=self.key, disabled=True, help=self.help, on_click=self.handle_click, args=(self.x, self.y, board))
@@ -132,7 +225,7 @@ class BoardCell:
                 return st.button("‎ ‎ ‎ ‎ ‎ ‎", key=self.key, disabled=True)
 
     @staticmethod  
-    def handle_click(x, y, board: Board, legal_moves = []):
+    def handle_click(x, y, board: Board):
         print(f"Clicked on {x}, {y}")
         
         # Update piece state
@@ -143,28 +236,18 @@ class BoardCell:
             st.session_state.legal_moves = []
         else:
             st.session_state.active_piece = (x, y)
-            piece_moves = board.board[x][y].piece.get_moves(board.board, x, y)
-            if legal_moves: piece_moves = [move for move in piece_moves if move in legal_moves] # Filter illegal moves if king is in check
-            st.session_state.legal_moves = piece_moves
+            st.session_state.legal_moves = board.analysis.legal_moves.get((x, y), [])
 
     @staticmethod
     def move_piece(x, y, board: Board):
         print(f"Moving to {x}, {y}")
 
-        # Move piece to x, y
-        piece = board.board[st.session_state.get('active_piece')[0]][st.session_state.get('active_piece')[1]].piece
-        board.board[x][y].piece = piece
-        if isinstance(piece, Pawn): piece.already_moved = True
+        # Move active piece to x, y, the board fragment then reruns the whole app
+        if board.move_piece(st.session_state.get('active_piece'), (x, y)): st.session_state.board_changed = True
 
-        # Remove piece from original position
-        board.board[st.session_state.get('active_piece')[0]][st.session_state.get('active_piece')[1]].piece = None
+        # Stop analysing the position that is gone, the next rerun starts on the new one
+        if "background_analysis" in st.session_state: st.session_state.background_analysis.cancel()
 
-        # Clear active piece and legal moves, change turn
+        # Clear active piece and legal moves
         st.session_state.active_piece = None
         st.session_state.legal_moves = []
-        st.session_state.whites_turn = not st.session_state.whites_turn
-        st.session_state.all_legal_moves = []
-        st.session_state.pieces_can_move = []
-
-        
-
@@ -0,0 +1,132 @@
+"""
+Opening book: a binary file of (position hash, move, weight) entries sorted by hash, built from
+PGN games and memory-mapped for lookups by binary search, nothing is parsed when it is opened.
+
+    python book.py build games.pgn [more.pgn ...] --max-ply 20   # writes book.bin next to this file
+    python book.py probe --fen "<FEN>"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import Counter
+
+from core import Position, STARTING_FEN, move_to_uci
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+MAGIC = b"CHBOOK01"
+ENTRY = struct.Struct("<QHH")  # hash, move, weight
+KEY = struct.Struct("<Q")
+MAX_WEIGHT = 0xFFFF
+
+
+def build_entries(games, max_ply=20):
+    """
+    Weights count how the moves scored for the side playing them, 2 per win and 1 per draw,
+    games is an iterable of (start Position, moves, result)
+    """
+    weights = Counter()
+    for position, moves, result in games:
+        for move in moves[:max_ply]:
+            won = result == ("1-0", "0-1")[position.turn]
+            lost = result == ("0-1", "1-0")[position.turn]
+            # Moves that only ever lost stay in the book with no weight, they're never chosen
+            weights[position.hash, move] += 2 if won else 0 if lost else 1
+            position.make_move(move)
+
+    # Scale down so the heaviest entry fits 16 bits
+    scale = max(1, -(-max(weights.values(), default=0) // MAX_WEIGHT))
+    return sorted((key, move, -(-weight // scale)) for (key, move), weight in weights.items())
+
+def write_book(path, entries):
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        for entry in entries: file.write(ENTRY.pack(*entry))
+
+def games_from_pgn(paths):
+    # Games with an illegal move are used up to the move before it
+    from pgn import read_pgn, parse_san
+
+    for game in read_pgn(paths):
+        try: position = Position(game.headers.get("FEN", STARTING_FEN))
+        except ValueError: continue
+        replay = position.copy()
+        moves = []
+        for san in game.moves:
+            try: moves.append(parse_san(replay, san))
+            except ValueError: break
+            replay.make_move(moves[-1])
+        yield position, moves, game.result
+
+
+class OpeningBook:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC: raise ValueError(f"{path} is not an opening book")
+        self.count = (len(self.data) - len(MAGIC)) // ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+
+    def _key(self, index):
+        return KEY.unpack_from(self.data, len(MAGIC) + index * ENTRY.size)[0]
+
+    def lookup(self, key):
+        """ (move, weight) of every book entry for the position hash """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key: low = middle + 1
+            else: high = middle
+
+        entries = []
+        while low < self.count:
+            entry_key, move, weight = ENTRY.unpack_from(self.data, len(MAGIC) + low * ENTRY.size)
+            if entry_key != key: break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+    def moves(self, position: Position):
+        """ Legal book moves, heaviest first, a colliding hash can't suggest an illegal move """
+        legal = set(position.legal_moves())
+        return sorted(((move, weight) for move, weight in self.lookup(position.hash) if move in legal and weight), key=lambda entry: -entry[1])
+
+    def choose(self, position: Position, rng=random):
+        """ A book move picked in proportion to its weight, None out of book """
+        moves = self.moves(position)
+        if not moves: return None
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe the opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build a book from PGN files")
+    build_parser.add_argument("paths", nargs="+")
+    build_parser.add_argument("--output", default=BOOK_PATH)
+    build_parser.add_argument("--max-ply", type=int, default=20, help="book depth in plies")
+    probe_parser = commands.add_parser("probe", help="list the book moves of a position")
+    probe_parser.add_argument("--book", default=BOOK_PATH)
+    probe_parser.add_argument("--fen", default=STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        entries = build_entries(games_from_pgn(args.paths), args.max_ply)
+        write_book(args.output, entries)
+        print(f"{len(entries)} entries written to {args.output}")
+    else:
+        book = OpeningBook(args.book)
+        for move, weight in book.moves(Position(args.fen)): print(f"{move_to_uci(move)} {weight}")
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,566 @@
+"""
+Headless chess rules: position, move generation and move making.
+Nothing in here imports Streamlit, so it can run in scripts, threads and subprocesses.
+"""
+import random
+import struct
+
+from magics import rook_attacks, bishop_attacks
+
+WHITE, BLACK = 0, 1
+COLORS = ("white", "black")
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_SYMBOLS = "PNBRQKpnbrqk"
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# Bitboards are ints with bit n set for square n
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_G = FILE_A << 6
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+NOT_A = FULL ^ FILE_A
+NOT_AB = FULL ^ (FILE_A | FILE_B)
+NOT_H = FULL ^ FILE_H
+NOT_GH = FULL ^ (FILE_G | FILE_H)
+DARK_SQUARES = 0xAA55AA55AA55AA55
+LIGHT_SQUARES = FULL ^ DARK_SQUARES
+
+# Game status, None while the game goes on
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+THREEFOLD_REPETITION = "threefold_repetition"
+FIFTY_MOVES = "fifty_moves"
+INSUFFICIENT_MATERIAL = "insufficient_material"
+
+def square(x, y):
+    """ x = rank, y = file, a1 = 0, h8 = 63 """
+    return x * 8 + y
+
+def piece_code(color, piece_type):
+    return color * 6 + piece_type
+
+def piece_color(code):
+    return code // 6
+
+def piece_type(code):
+    return code % 6
+
+# Moves are packed into ints: from square, to square and promotion piece type (0 = none)
+def encode_move(from_sq, to_sq, promotion=0):
+    return from_sq | to_sq << 6 | promotion << 12
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return move >> 6 & 63
+
+def move_promotion(move):
+    return move >> 12
+
+def square_name(sq):
+    return "abcdefgh"[sq % 8] + str(sq // 8 + 1)
+
+def move_to_uci(move):
+    uci = square_name(move_from(move)) + square_name(move_to(move))
+    if move_promotion(move): uci += PIECE_SYMBOLS[6 + move_promotion(move)]
+    return uci
+
+def lsb_square(bb):
+    return (bb & -bb).bit_length() - 1
+
+def iter_squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+def knight_attacks(bb):
+    return (((bb << 17) & NOT_A) | ((bb << 15) & NOT_H) | ((bb << 10) & NOT_AB) | ((bb << 6) & NOT_GH)
+            | ((bb >> 17) & NOT_H) | ((bb >> 15) & NOT_A) | ((bb >> 10) & NOT_GH) | ((bb >> 6) & NOT_AB)) & FULL
+
+def king_attacks(bb):
+    sideways = ((bb << 1) & NOT_A) | ((bb >> 1) & NOT_H)
+    row = bb | sideways
+    return (sideways | (row << 8) | (row >> 8)) & FULL
+
+def pawn_attacks(color, bb):
+    if color == WHITE: return (((bb << 9) & NOT_A) | ((bb << 7) & NOT_H)) & FULL
+    return ((bb >> 7) & NOT_A) | ((bb >> 9) & NOT_H)
+
+# Per-square attack tables, built once at import
+KNIGHT_ATTACKS = [knight_attacks(1 << sq) for sq in range(64)]
+KING_ATTACKS = [king_attacks(1 << sq) for sq in range(64)]
+PAWN_ATTACKS = [[pawn_attacks(color, 1 << sq) for sq in range(64)] for color in (WHITE, BLACK)]
+
+def _between(a, b):
+    # Squares strictly between a and b if they share a rank, file or diagonal
+    ax, ay = divmod(a, 8)
+    bx, by = divmod(b, 8)
+    dx, dy = bx - ax, by - ay
+    if a == b or not (dx == 0 or dy == 0 or abs(dx) == abs(dy)): return 0
+    step_x, step_y = (dx > 0) - (dx < 0), (dy > 0) - (dy < 0)
+    between = 0
+    x, y = ax + step_x, ay + step_y
+    while (x, y) != (bx, by):
+        between |= 1 << square(x, y)
+        x, y = x + step_x, y + step_y
+    return between
+
+BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]
+
+# Zobrist keys, seeded so hashes are stable across processes and runs
+_zobrist = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist.getrandbits(64) for sq in range(64)] for code in range(12)]
+ZOBRIST_CASTLING = [_zobrist.getrandbits(64) for rights in range(16)]
+ZOBRIST_EP_FILE = [_zobrist.getrandbits(64) for y in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist.getrandbits(64)
+
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+CASTLING_SYMBOLS = (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE))
+
+
+class Position:
+    def __init__(self, fen=STARTING_FEN):
+        self._clear()
+        fields = fen.split()
+        if len(fields) not in (4, 6): raise ValueError(f"Invalid FEN: {fen}")
+        placement, turn, castling, ep_square = fields[:4]
+
+        ranks = placement.split("/")
+        if len(ranks) != 8: raise ValueError(f"Invalid FEN placement: {placement}")
+        for i, rank in enumerate(ranks):
+            x, y = 7 - i, 0
+            for char in rank:
+                if char in "12345678": y += int(char)
+                elif char in PIECE_SYMBOLS and y < 8:
+                    self._put(square(x, y), PIECE_SYMBOLS.index(char))
+                    y += 1
+                else: raise ValueError(f"Invalid FEN placement: {placement}")
+            if y != 8: raise ValueError(f"Invalid FEN placement: {placement}")
+        if bin(self.pieces[KING]).count("1") != 1 or bin(self.pieces[6 + KING]).count("1") != 1:
+            raise ValueError(f"FEN needs exactly one king per side: {placement}")
+
+        if (self.pieces[PAWN] | self.pieces[6 + PAWN]) & (RANK_1 | RANK_8):
+            raise ValueError(f"FEN has a pawn on the first or last rank: {placement}")
+
+        if turn not in ("w", "b"): raise ValueError(f"Invalid FEN side to move: {turn}")
+        self.turn = WHITE if turn == "w" else BLACK
+        # The side to move could take the king
+        if self.is_square_attacked(self.king_square(1 - self.turn), self.turn):
+            raise ValueError(f"Side not to move is in check: {fen}")
+
+        if castling != "-" and (not castling or any(char not in "KQkq" for char in castling)):
+            raise ValueError(f"Invalid FEN castling rights: {castling}")
+        self.castling = sum(bit for char, bit in CASTLING_SYMBOLS if char in castling)
+        # Drop the rights whose king or rook is not on its home square
+        for sq, rights in CASTLING_SQUARES.items():
+            home = (KING if sq % 8 == 4 else ROOK) + (6 if sq >= 56 else 0)
+            if self.squares[sq] != home: self.castling &= ~rights
+
+        # Only keep an en passant square a pawn can capture on, like make_move does
+        self.ep_square = None
+        if ep_square != "-":
+            if len(ep_square) != 2 or ep_square[0] not in "abcdefgh" or ep_square[1] not in "36":
+                raise ValueError(f"Invalid FEN en passant square: {ep_square}")
+            sq = square(int(ep_square[1]) - 1, "abcdefgh".index(ep_square[0]))
+            # Behind a pawn of the other side that just moved two squares, from the side to move's view
+            forward = 8 if self.turn == WHITE else -8
+            pushed = ep_square[1] == ("6" if self.turn == WHITE else "3") and self.squares[sq - forward] == (1 - self.turn) * 6 + PAWN
+            empty = self.squares[sq] is None and self.squares[sq + forward] is None
+            if pushed and empty and PAWN_ATTACKS[1 - self.turn][sq] & self.pieces[self.turn * 6 + PAWN]: self.ep_square = sq
+
+        try:
+            self.halfmove_clock = int(fields[4]) if len(fields) == 6 else 0
+            self.fullmove_number = int(fields[5]) if len(fields) == 6 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN move counters: {fen}") from None
+        # Both counters are stored in 16 bits by to_bytes
+        if not 0 <= self.halfmove_clock <= 0xFFFF or not 1 <= self.fullmove_number <= 0xFFFF:
+            raise ValueError(f"FEN move counters out of range: {fen}")
+        self.hash = self.compute_hash()
+
+    def _clear(self):
+        # Twelve piece bitboards indexed by piece code, occupancy per color and a square lookup
+        self.pieces = [0] * 12
+        self.occupied = [0, 0]
+        self.squares = [None] * 64
+        self.hash = 0
+        # Undo records: (move, captured piece, castling rights, en passant square, halfmove clock, hash)
+        self.undo_stack = []
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(fen)
+
+    def to_fen(self):
+        ranks = []
+        for x in range(7, -1, -1):
+            rank, empty = "", 0
+            for y in range(8):
+                code = self.squares[square(x, y)]
+                if code is None:
+                    empty += 1
+                    continue
+                if empty: rank += str(empty)
+                rank += PIECE_SYMBOLS[code]
+                empty = 0
+            if empty: rank += str(empty)
+            ranks.append(rank)
+
+        castling = "".join(char for char, bit in CASTLING_SYMBOLS if self.castling & bit) or "-"
+        ep_square = square_name(self.ep_square) if self.ep_square is not None else "-"
+        return f"{'/'.join(ranks)} {'wb'[self.turn]} {castling} {ep_square} {self.halfmove_clock} {self.fullmove_number}"
+
+    def to_bytes(self):
+        """
+        Compact encoding of at most 30 bytes: occupancy bitboard, flags (side to move,
+        castling rights, en passant file), both move counters and a nibble per piece
+        """
+        occupied = self.occupied[0] | self.occupied[1]
+        codes = [self.squares[sq] for sq in iter_squares(occupied)]
+        if len(codes) % 2: codes.append(0)
+        packed = bytes(codes[i] | codes[i + 1] << 4 for i in range(0, len(codes), 2))
+        ep_file = 0 if self.ep_square is None else self.ep_square % 8 + 1
+        flags = self.turn | self.castling << 1 | ep_file << 5
+        return struct.pack("<QHHH", occupied, flags, self.halfmove_clock, self.fullmove_number) + packed
+
+    @classmethod
+    def from_bytes(cls, data):
+        position = cls.__new__(cls)
+        position._clear()
+        occupied, flags, position.halfmove_clock, position.fullmove_number = struct.unpack_from("<QHHH", data)
+        packed = data[struct.calcsize("<QHHH"):]
+        for i, sq in enumerate(iter_squares(occupied)):
+            position._put(sq, packed[i // 2] >> (4 * (i % 2)) & 15)
+
+        position.turn = flags & 1
+        position.castling = flags >> 1 & 15
+        ep_file = flags >> 5 & 15
+        # The en passant square sits behind the pawn that just moved
+        position.ep_square = None if not ep_file else square(5 if position.turn == WHITE else 2, ep_file - 1)
+        position.hash = position.compute_hash()
+        return position
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.pieces = self.pieces[:]
+        position.occupied = self.occupied[:]
+        position.squares = self.squares[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.hash = self.hash
+        position.undo_stack = self.undo_stack[:]
+        return position
+
+    def _put(self, sq, code):
+        bit = 1 << sq
+        self.pieces[code] |= bit
+        self.occupied[code // 6] |= bit
+        self.squares[sq] = code
+        self.hash ^= ZOBRIST_PIECES[code][sq]
+
+    def _remove(self, sq):
+        code = self.squares[sq]
+        bit = 1 << sq
+        self.pieces[code] ^= bit
+        self.occupied[code // 6] ^= bit
+        self.squares[sq] = None
+        self.hash ^= ZOBRIST_PIECES[code][sq]
+        return code
+
+    def compute_hash(self):
+        # Full recomputation, make_move keeps self.hash up to date incrementally
+        h = ZOBRIST_CASTLING[self.castling]
+        for sq, code in enumerate(self.squares):
+            if code is not None: h ^= ZOBRIST_PIECES[code][sq]
+        if self.ep_square is not None: h ^= ZOBRIST_EP_FILE[self.ep_square % 8]
+        if self.turn == BLACK: h ^= ZOBRIST_BLACK_TO_MOVE
+        return h
+
+    def piece_at(self, sq):
+        return self.squares[sq]
+
+    def king_square(self, color):
+        king = self.pieces[color * 6 + KING]
+        return lsb_square(king) if king else None
+
+    def attackers(self, sq, by_color):
+        pieces = self.pieces
+        base = by_color * 6
+        occupied = self.occupied[0] | self.occupied[1]
+        queens = pieces[base + QUEEN]
+        return ((PAWN_ATTACKS[1 - by_color][sq] & pieces[base + PAWN])
+                | (KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT])
+                | (KING_ATTACKS[sq] & pieces[base + KING])
+                | (rook_attacks(sq, occupied) & (pieces[base + ROOK] | queens))
+                | (bishop_attacks(sq, occupied) & (pieces[base + BISHOP] | queens)))
+
+    def is_square_attacked(self, sq, by_color, occupied=None):
+        pieces = self.pieces
+        base = by_color * 6
+        if PAWN_ATTACKS[1 - by_color][sq] & pieces[base + PAWN]: return True
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]: return True
+        if KING_ATTACKS[sq] & pieces[base + KING]: return True
+
+        if occupied is None: occupied = self.occupied[0] | self.occupied[1]
+        queens = pieces[base + QUEEN]
+        rooks = pieces[base + ROOK] | queens
+        if rooks and rook_attacks(sq, occupied) & rooks: return True
+        bishops = pieces[base + BISHOP] | queens
+        if bishops and bishop_attacks(sq, occupied) & bishops: return True
+        return False
+
+    def is_check(self):
+        return self.is_square_attacked(self.king_square(self.turn), 1 - self.turn)
+
+    def repetitions(self):
+        """ Occurrences of the current position, the history is only scanned back to the last capture or pawn move """
+        count = 1
+        undo_stack = self.undo_stack
+        # Same side to move every second ply, the stored hash is the position before that move
+        for i in range(len(undo_stack) - 2, len(undo_stack) - 1 - self.halfmove_clock, -2):
+            if i < 0: break
+            if undo_stack[i][5] == self.hash: count += 1
+        return count
+
+    def is_insufficient_material(self):
+        pieces = self.pieces
+        if any(pieces[color * 6 + kind] for color in (WHITE, BLACK) for kind in (PAWN, ROOK, QUEEN)): return False
+        knights = pieces[KNIGHT] | pieces[6 + KNIGHT]
+        bishops = pieces[BISHOP] | pieces[6 + BISHOP]
+        if bin(knights | bishops).count("1") <= 1: return True
+        # Any number of bishops that all stand on one square colour can't mate
+        return not knights and (not bishops & LIGHT_SQUARES or not bishops & DARK_SQUARES)
+
+    def status(self, legal_moves=None):
+        """ Game status of the position, pass legal_moves when they are already known """
+        if legal_moves is None: legal_moves = self.legal_moves()
+        if not legal_moves: return CHECKMATE if self.is_check() else STALEMATE
+        if self.halfmove_clock >= 100: return FIFTY_MOVES
+        if self.repetitions() >= 3: return THREEFOLD_REPETITION
+        if self.is_insufficient_material(): return INSUFFICIENT_MATERIAL
+        return None
+
+    def _pawn_moves(self, moves):
+        color = self.turn
+        pawns = self.pieces[color * 6 + PAWN]
+        empty = FULL ^ (self.occupied[0] | self.occupied[1])
+        enemies = self.occupied[1 - color]
+        if self.ep_square is not None: enemies |= 1 << self.ep_square
+
+        # Targets are generated for all pawns at once, the from square is a fixed offset away
+        if color == WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            forward = 8
+            left = ((pawns << 7) & NOT_H) & enemies
+            right = ((pawns << 9) & NOT_A) & enemies
+            left_offset, right_offset = 7, 9
+            last_rank = RANK_8
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            forward = -8
+            left = ((pawns >> 9) & NOT_H) & enemies
+            right = ((pawns >> 7) & NOT_A) & enemies
+            left_offset, right_offset = -9, -7
+            last_rank = RANK_1
+
+        for to_sq in iter_squares(double):
+            moves.append((to_sq - 2 * forward) | to_sq << 6)
+        for targets, offset in ((single, forward), (left, left_offset), (right, right_offset)):
+            for to_sq in iter_squares(targets & ~last_rank):
+                moves.append((to_sq - offset) | to_sq << 6)
+            for to_sq in iter_squares(targets & last_rank):
+                for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    moves.append(encode_move(to_sq - offset, to_sq, promotion))
+
+    def _castling_moves(self, moves):
+        color = self.turn
+        enemy = 1 - color
+        occupied = self.occupied[0] | self.occupied[1]
+        rank = 0 if color == WHITE else 7
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if color == WHITE else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+        king = square(rank, 4)
+
+        if not self.castling & (kingside | queenside) or self.squares[king] != piece_code(color, KING): return
+        if self.is_square_attacked(king, enemy): return
+
+        # King may not pass through or land on an attacked square
+        if self.castling & kingside and not occupied & (0b11 << (king + 1)):
+            if not self.is_square_attacked(king + 1, enemy) and not self.is_square_attacked(king + 2, enemy):
+                moves.append(encode_move(king, king + 2))
+        if self.castling & queenside and not occupied & (0b111 << (king - 3)):
+            if not self.is_square_attacked(king - 1, enemy) and not self.is_square_attacked(king - 2, enemy):
+                moves.append(encode_move(king, king - 2))
+
+    def legal_moves(self):
+        """
+        Checkers, the check evasion mask and pin rays are computed once,
+        so every generated move is legal without making it first
+        """
+        pieces = self.pieces
+        color = self.turn
+        enemy = 1 - color
+        base, enemy_base = color * 6, enemy * 6
+        own = self.occupied[color]
+        occupied = own | self.occupied[enemy]
+        king_sq = lsb_square(pieces[base + KING])
+        checkers = self.attackers(king_sq, enemy)
+        moves = []
+
+        # King moves, with the king lifted off the board so it cannot step back along a checking ray
+        without_king = occupied ^ (1 << king_sq)
+        for to_sq in iter_squares(KING_ATTACKS[king_sq] & ~own):
+            if not self.is_square_attacked(to_sq, enemy, without_king): moves.append(king_sq | to_sq << 6)
+
+        # Double check, only the king can move
+        if checkers & (checkers - 1): return moves
+
+        if checkers:
+            # Capture the checker or block its ray
+            checker_sq = lsb_square(checkers)
+            evasions = checkers | BETWEEN[king_sq][checker_sq]
+        else:
+            evasions = FULL
+            self._castling_moves(moves)
+
+        # Enemy sliders that see the king through exactly one own piece pin it to their ray
+        pin_rays = {}
+        queens = pieces[enemy_base + QUEEN]
+        snipers = ((rook_attacks(king_sq, self.occupied[enemy]) & (pieces[enemy_base + ROOK] | queens))
+                   | (bishop_attacks(king_sq, self.occupied[enemy]) & (pieces[enemy_base + BISHOP] | queens)))
+        for sniper_sq in iter_squares(snipers):
+            blockers = BETWEEN[king_sq][sniper_sq] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pin_rays[lsb_square(blockers)] = BETWEEN[king_sq][sniper_sq] | (1 << sniper_sq)
+
+        targets = ~own & evasions
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            for sq in iter_squares(pieces[base + kind]):
+                if kind == KNIGHT:
+                    # A pinned knight can never stay on its ray
+                    if sq in pin_rays: continue
+                    attacks = KNIGHT_ATTACKS[sq]
+                elif kind == BISHOP: attacks = bishop_attacks(sq, occupied)
+                elif kind == ROOK: attacks = rook_attacks(sq, occupied)
+                else: attacks = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                attacks &= targets
+                if sq in pin_rays: attacks &= pin_rays[sq]
+                for to_sq in iter_squares(attacks):
+                    moves.append(sq | to_sq << 6)
+
+        pawn_moves = []
+        self._pawn_moves(pawn_moves)
+        for move in pawn_moves:
+            from_sq, to_sq = move & 63, move >> 6 & 63
+            if to_sq == self.ep_square:
+                if self._is_en_passant_legal(from_sq, to_sq, king_sq, evasions): moves.append(move)
+                continue
+            if not (1 << to_sq) & evasions: continue
+            if from_sq in pin_rays and not (1 << to_sq) & pin_rays[from_sq]: continue
+            moves.append(move)
+
+        return moves
+
+    def _is_en_passant_legal(self, from_sq, to_sq, king_sq, evasions):
+        # Two pawns leave the rank at once, so test the enemy sliders against the resulting occupancy
+        captured_sq = to_sq - 8 if self.turn == WHITE else to_sq + 8
+        if not ((1 << to_sq) | (1 << captured_sq)) & evasions: return False
+        enemy_base = (1 - self.turn) * 6
+        occupied = (self.occupied[0] | self.occupied[1]) ^ (1 << from_sq) ^ (1 << captured_sq) | (1 << to_sq)
+        queens = self.pieces[enemy_base + QUEEN]
+        if rook_attacks(king_sq, occupied) & (self.pieces[enemy_base + ROOK] | queens): return False
+        if bishop_attacks(king_sq, occupied) & (self.pieces[enemy_base + BISHOP] | queens): return False
+        return True
+
+    def make_move(self, move):
+        from_sq, to_sq, promotion = move_from(move), move_to(move), move_promotion(move)
+        color = self.turn
+        piece = self.squares[from_sq]
+        kind = piece_type(piece)
+
+        # En passant, the captured pawn stands behind the target square
+        captured_sq = to_sq
+        if kind == PAWN and to_sq == self.ep_square: captured_sq = to_sq - 8 if color == WHITE else to_sq + 8
+        captured = self.squares[captured_sq]
+        self.undo_stack.append((move, captured, self.castling, self.ep_square, self.halfmove_clock, self.hash))
+
+        self._remove(from_sq)
+        if captured is not None: self._remove(captured_sq)
+        self._put(to_sq, piece_code(color, promotion) if promotion else piece)
+
+        if kind == KING and abs(to_sq - from_sq) == 2:
+            # Castling, move the rook over the king
+            if to_sq > from_sq: rook_from, rook_to = to_sq + 1, to_sq - 1
+            else: rook_from, rook_to = to_sq - 2, to_sq + 1
+            self._put(rook_to, self._remove(rook_from))
+
+        # Castling rights are lost when the king or a rook leaves or is captured on its square
+        castling = self.castling
+        for sq in (from_sq, to_sq):
+            if sq in CASTLING_SQUARES: castling &= ~CASTLING_SQUARES[sq]
+        if castling != self.castling:
+            self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+
+        # The en passant square is only kept when an enemy pawn can actually capture,
+        # so transpositions with an unusable en passant square hash the same
+        if self.ep_square is not None: self.hash ^= ZOBRIST_EP_FILE[self.ep_square % 8]
+        self.ep_square = None
+        if kind == PAWN and abs(to_sq - from_sq) == 16:
+            ep_square = (from_sq + to_sq) // 2
+            if PAWN_ATTACKS[color][ep_square] & self.pieces[(1 - color) * 6 + PAWN]:
+                self.ep_square = ep_square
+                self.hash ^= ZOBRIST_EP_FILE[ep_square % 8]
+
+        if kind == PAWN or captured is not None: self.halfmove_clock = 0
+        else: self.halfmove_clock += 1
+        if color == BLACK: self.fullmove_number += 1
+        self.turn = 1 - color
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+
+    def unmake_move(self):
+        move, captured, self.castling, self.ep_square, self.halfmove_clock, saved_hash = self.undo_stack.pop()
+        from_sq, to_sq, promotion = move_from(move), move_to(move), move_promotion(move)
+        self.turn = color = 1 - self.turn
+        if color == BLACK: self.fullmove_number -= 1
+
+        piece = self._remove(to_sq)
+        if promotion: piece = piece_code(color, PAWN)
+        self._put(from_sq, piece)
+        kind = piece_type(piece)
+
+        if kind == PAWN and to_sq == self.ep_square:
+            self._put(to_sq - 8 if color == WHITE else to_sq + 8, captured)
+        elif captured is not None:
+            self._put(to_sq, captured)
+        elif kind == KING and abs(to_sq - from_sq) == 2:
+            if to_sq > from_sq: rook_from, rook_to = to_sq + 1, to_sq - 1
+            else: rook_from, rook_to = to_sq - 2, to_sq + 1
+            self._put(rook_from, self._remove(rook_to))
+
+        self.hash = saved_hash
+
+
+CASTLING_SQUARES = {
+    square(0, 4): WHITE_KINGSIDE | WHITE_QUEENSIDE,
+    square(0, 7): WHITE_KINGSIDE,
+    square(0, 0): WHITE_QUEENSIDE,
+    square(7, 4): BLACK_KINGSIDE | BLACK_QUEENSIDE,
+    square(7, 7): BLACK_KINGSIDE,
+    square(7, 0): BLACK_QUEENSIDE,
+}
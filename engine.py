@@ -0,0 +1,316 @@
+"""
+Computer opponent: iterative deepening alpha-beta with move ordering and quiescence search,
+bounded by a time and/or node budget. Runs on core.Position, no Streamlit needed.
+"""
+import time
+
+from tt import TranspositionTable, EXACT, LOWER, UPPER
+from core import Position, WHITE, PAWN, BISHOP, ROOK, KING, iter_squares, move_from, move_to, move_promotion
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square tables from white's point of view, written rank 8 first like a diagram
+PAWN_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_TABLE = (
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+)
+KING_ENDGAME_TABLE = (
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+)
+TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+
+def _square_values(table, value):
+    # Material plus table bonus per piece code and square, positive for white
+    white = [value + table[(7 - sq // 8) * 8 + sq % 8] for sq in range(64)]
+    black = [-(value + table[sq]) for sq in range(64)]
+    return white, black
+
+PIECE_SQUARE = [None] * 12
+for _kind in range(6):
+    PIECE_SQUARE[_kind], PIECE_SQUARE[6 + _kind] = _square_values(TABLES[_kind], PIECE_VALUES[_kind])
+KING_ENDGAME_SQUARE = _square_values(KING_ENDGAME_TABLE, 0)
+
+# Below this much non-pawn material on the board the kings use the endgame table
+ENDGAME_MATERIAL = 2 * PIECE_VALUES[ROOK] + 2 * PIECE_VALUES[BISHOP]
+
+
+def evaluate(position: Position):
+    """ Static evaluation in centipawns from the side to move's point of view """
+    pieces = position.pieces
+    score = 0
+    material = 0
+    for code in range(12):
+        if code % 6 == KING: continue
+        values = PIECE_SQUARE[code]
+        for sq in iter_squares(pieces[code]):
+            score += values[sq]
+        if code % 6 != PAWN: material += PIECE_VALUES[code % 6] * bin(pieces[code]).count("1")
+
+    white_king, black_king = (PIECE_SQUARE[KING], PIECE_SQUARE[6 + KING]) if material > ENDGAME_MATERIAL else KING_ENDGAME_SQUARE
+    for sq in iter_squares(pieces[KING]): score += white_king[sq]
+    for sq in iter_squares(pieces[6 + KING]): score += black_king[sq]
+
+    return score if position.turn == WHITE else -score
+
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchResult:
+    def __init__(self, best_move=None, score=0, depth=0, nodes=0, elapsed=0.0, pv=None, source="search"):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv or []
+        self.source = source  # "search", "book" or "tablebase"
+
+def tablebase_score(value, ply):
+    # Table values are plies to mate + 1 from the side to move, a draw is 0
+    if value > 0: return MATE - ply - (value - 1)
+    if value < 0: return -MATE + ply + (-value - 1)
+    return 0
+
+def score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE - MAX_PLY: return score + ply
+    if score < -MATE + MAX_PLY: return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE - MAX_PLY: return score - ply
+    if score < -MATE + MAX_PLY: return score + ply
+    return score
+
+
+class Engine:
+    def __init__(self, tt_size_mb=8, tt: TranspositionTable = None, book=None, tablebases=None):
+        # The table is kept between searches, later moves reuse what earlier ones found
+        self.tt = tt if tt is not None else TranspositionTable(tt_size_mb)
+        self.book = book  # book.OpeningBook
+        self.tablebases = tablebases  # tablebase.Tablebases
+        self.nodes = 0
+        self.deadline = None
+        self.node_limit = None
+        self.stop_event = None
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.previous_pv = []
+
+    def search(self, position: Position, time_limit=1.0, node_limit=None, max_depth=MAX_PLY, on_iteration=None, start_depth=1, stop_event=None):
+        """
+        Deepen one ply at a time until the time (seconds) or node budget runs out
+        or stop_event (threading.Event) is set, the result of the last completed iteration is returned
+        """
+        start = time.perf_counter()
+        position = position.copy()  # An aborted search leaves moves on the stack
+        self.deadline = start + time_limit if time_limit else None
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.previous_pv = []
+
+        # Known openings and endings are answered without searching
+        if self.book is not None:
+            book_move = self.book.choose(position)
+            if book_move is not None: return SearchResult(book_move, elapsed=time.perf_counter() - start, pv=[book_move], source="book")
+        if self.tablebases is not None:
+            best = self.tablebases.best_move(position)
+            if best is not None: return SearchResult(best[0], tablebase_score(best[1], 0), elapsed=time.perf_counter() - start, pv=[best[0]], source="tablebase")
+
+        root_moves = position.legal_moves()
+        result = SearchResult(root_moves[0] if root_moves else None)
+        # Nothing to think about with a single reply
+        if len(root_moves) <= 1: return result
+
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            pv = []
+            try:
+                score = self._negamax(position, depth, -INFINITY, INFINITY, 0, pv)
+            except SearchTimeout:
+                break
+            self.previous_pv = pv
+            result = SearchResult(pv[0], score, depth, self.nodes, time.perf_counter() - start, pv)
+            if on_iteration: on_iteration(result)
+
+            if abs(score) > MATE - MAX_PLY: break
+            # The next iteration would not finish in the remaining time anyway
+            if self.deadline and time.perf_counter() - start > (self.deadline - start) / 2: break
+
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.node_limit and self.nodes >= self.node_limit: raise SearchTimeout
+        # Reading the clock is slower than a node, only look every 256 nodes
+        if self.nodes & 255 == 0:
+            if self.deadline and time.perf_counter() > self.deadline: raise SearchTimeout
+            if self.stop_event is not None and self.stop_event.is_set(): raise SearchTimeout
+
+    def _order(self, position: Position, moves, ply, tt_move=0):
+        squares = position.squares
+        pv_move = self.previous_pv[ply] if ply < len(self.previous_pv) else 0
+        killers = self.killers[ply]
+
+        def score(move):
+            if move == tt_move: return 2000000
+            if move == pv_move: return 1000000
+            victim = squares[move_to(move)]
+            if victim is not None:
+                # Most valuable victim, least valuable attacker
+                return 100000 + 10 * PIECE_VALUES[victim % 6] - PIECE_VALUES[squares[move_from(move)] % 6]
+            if move_promotion(move): return 90000
+            if move == killers[0]: return 80000
+            if move == killers[1]: return 79000
+            return 0
+
+        return sorted(moves, key=score, reverse=True)
+
+    def _negamax(self, position: Position, depth, alpha, beta, ply, pv):
+        if ply >= MAX_PLY - 1: return evaluate(position)
+        in_check = position.is_check()
+        # Check extension, never drop into quiescence while in check
+        if in_check: depth += 1
+        if depth <= 0: return self._quiescence(position, alpha, beta, ply)
+
+        self._count_node()
+        # Exact result once the search reaches a solved ending
+        if self.tablebases is not None and ply > 0:
+            value = self.tablebases.probe(position)
+            if value is not None: return tablebase_score(value, ply)
+
+        moves = position.legal_moves()
+        if not moves: return -MATE + ply if in_check else 0
+        if position.halfmove_clock >= 100: return 0
+        # A position repeated inside the search line or the game is scored as a draw
+        if ply > 0 and position.repetitions() > 1: return 0
+
+        # The root always searches, so it keeps a full principal variation
+        key = position.hash
+        entry = self.tt.probe(key)
+        tt_move = 0
+        if entry:
+            tt_depth, bound, tt_score, tt_move = entry
+            if ply > 0 and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if bound == EXACT: return tt_score
+                if bound == LOWER and tt_score >= beta: return tt_score
+                if bound == UPPER and tt_score <= alpha: return tt_score
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = 0
+        child_pv = []
+        for move in self._order(position, moves, ply, tt_move):
+            position.make_move(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1, child_pv)
+            position.unmake_move()
+
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[:] = [move] + child_pv
+                    if score >= beta:
+                        if position.squares[move_to(move)] is None and not move_promotion(move):
+                            killers = self.killers[ply]
+                            if killers[0] != move: killers[0], killers[1] = move, killers[0]
+                        break
+            child_pv.clear()
+
+        if best >= beta: bound = LOWER
+        elif best > original_alpha: bound = EXACT
+        else: bound = UPPER
+        self.tt.store(key, depth, bound, score_to_tt(best, ply), best_move)
+        return best
+
+    def _quiescence(self, position: Position, alpha, beta, ply):
+        self._count_node()
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY - 1: return stand_pat
+        if stand_pat > alpha: alpha = stand_pat
+
+        # Only captures and promotions, so the static evaluation is not taken mid-exchange
+        squares = position.squares
+        ep_square = position.ep_square
+        noisy = [move for move in position.legal_moves()
+                 if squares[move_to(move)] is not None or move_promotion(move)
+                 or (move_to(move) == ep_square and squares[move_from(move)] % 6 == PAWN)]
+        for move in self._order(position, noisy, ply):
+            position.make_move(move)
+            score = -self._quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta: return score
+            if score > alpha: alpha = score
+        return alpha
@@ -0,0 +1,155 @@
+"""
+Local SQLite store of games. Moves are kept as packed 16-bit codes (the move int of core.py fits
+in 15 bits) and every position of every game is indexed by its Zobrist hash, so the games that
+reached a position are found with one indexed lookup.
+
+    python gamestore.py import games.pgn [more.pgn ...]   # add PGN games to games.db next to this file
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+
+from core import Position, STARTING_FEN
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.db")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    white TEXT,
+    black TEXT,
+    result TEXT,
+    start_fen TEXT NOT NULL,
+    plies INTEGER NOT NULL,
+    moves BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    game_id INTEGER NOT NULL REFERENCES games(id) ON DELETE CASCADE,
+    ply INTEGER NOT NULL,
+    PRIMARY KEY (hash, game_id, ply)
+) WITHOUT ROWID;
+"""
+
+
+def pack_moves(moves):
+    codes = array("H", moves)
+    if sys.byteorder == "big": codes.byteswap()
+    return codes.tobytes()
+
+def unpack_moves(data):
+    codes = array("H")
+    codes.frombytes(data)
+    if sys.byteorder == "big": codes.byteswap()
+    return codes
+
+def signed_hash(key):
+    # SQLite integers are signed 64-bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class GameStore:
+    def __init__(self, path=DB_PATH):
+        # One connection shared by the Streamlit session threads, reads and writes go through the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.connection.close()
+
+    def add_game(self, moves, start_fen=STARTING_FEN, result="*", white=None, black=None):
+        return self.add_games([{"moves": moves, "start_fen": start_fen, "result": result, "white": white, "black": black}])[0]
+
+    def add_games(self, games):
+        """
+        Insert games (dicts with moves and optional start_fen, result, white, black) in one transaction,
+        returns their ids. Every position is replayed once to index its hash
+        """
+        ids = []
+        with self.lock, self.connection:
+            for game in games:
+                start_fen = game.get("start_fen") or STARTING_FEN
+                moves = list(game["moves"])
+                cursor = self.connection.execute(
+                    "INSERT INTO games (white, black, result, start_fen, plies, moves, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (game.get("white"), game.get("black"), game.get("result", "*"), start_fen, len(moves), pack_moves(moves), time.time()))
+                game_id = cursor.lastrowid
+
+                position = Position(start_fen)
+                rows = [(signed_hash(position.hash), game_id, 0)]
+                for ply, move in enumerate(moves, 1):
+                    position.make_move(move)
+                    rows.append((signed_hash(position.hash), game_id, ply))
+                self.connection.executemany("INSERT OR IGNORE INTO positions (hash, game_id, ply) VALUES (?, ?, ?)", rows)
+                ids.append(game_id)
+        return ids
+
+    def get_game(self, game_id):
+        with self.lock:
+            row = self.connection.execute("SELECT id, white, black, result, start_fen, plies, moves, created FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None: return None
+        return {"id": row[0], "white": row[1], "black": row[2], "result": row[3], "start_fen": row[4], "plies": row[5], "moves": unpack_moves(row[6]), "created": row[7]}
+
+    def games_with_position(self, key, limit=100):
+        """ (game id, ply, white, black, result) of the games that reached the position with this hash """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT p.game_id, p.ply, g.white, g.black, g.result FROM positions p JOIN games g ON g.id = p.game_id"
+                " WHERE p.hash = ? ORDER BY p.game_id DESC LIMIT ?", (signed_hash(key), limit)).fetchall()
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+
+def import_pgn(store: GameStore, paths, batch_size=500):
+    """ Add every PGN game that replays without errors, returns (imported, skipped) """
+    from pgn import read_pgn, parse_san
+
+    imported = skipped = 0
+    batch = []
+    for game in read_pgn(paths):
+        start_fen = game.headers.get("FEN", STARTING_FEN)
+        try:
+            position = Position(start_fen)
+            moves = []
+            for san in game.moves:
+                moves.append(parse_san(position, san))
+                position.make_move(moves[-1])
+        except ValueError:
+            skipped += 1
+            continue
+
+        batch.append({"moves": moves, "start_fen": start_fen, "result": game.result, "white": game.headers.get("White"), "black": game.headers.get("Black")})
+        if len(batch) == batch_size:
+            imported += len(store.add_games(batch))
+            batch = []
+    if batch: imported += len(store.add_games(batch))
+    return imported, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local game store.")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="add games from PGN files")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--batch-size", type=int, default=500, help="games per transaction")
+    args = parser.parse_args(argv)
+
+    store = GameStore(args.db)
+    start = time.perf_counter()
+    imported, skipped = import_pgn(store, args.paths, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"Imported: {imported}  Skipped: {skipped}  Time: {elapsed:.2f}s  Games/s: {imported / max(elapsed, 1e-9):,.1f}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+Move history of one game: 16-bit moves plus a to_bytes snapshot every `interval` plies,
+so any ply is rebuilt from the nearest snapshot by replaying fewer than `interval` moves.
+"""
+from array import array
+
+from core import Position
+
+
+class GameHistory:
+    def __init__(self, start: Position, interval=16):
+        self.interval = interval
+        self.moves = array("H")
+        # Snapshot i is the position after i * interval plies
+        self.snapshots = [start.to_bytes()]
+
+    def __len__(self):
+        return len(self.moves)
+
+    def push(self, move, position: Position):
+        """ Record move, position is the one after it """
+        self.moves.append(move)
+        if len(self.moves) % self.interval == 0: self.snapshots.append(position.to_bytes())
+
+    def pop(self):
+        move = self.moves.pop()
+        if len(self.snapshots) > len(self.moves) // self.interval + 1: self.snapshots.pop()
+        return move
+
+    def position_at(self, ply):
+        if not 0 <= ply <= len(self.moves): raise IndexError(f"Ply {ply} out of range 0..{len(self.moves)}")
+        index = ply // self.interval
+        position = Position.from_bytes(self.snapshots[index])
+        for move in self.moves[index * self.interval:ply]: position.make_move(move)
+        return position
+
+    def size_bytes(self):
+        return self.moves.itemsize * len(self.moves) + sum(len(snapshot) for snapshot in self.snapshots)
@@ -0,0 +1,174 @@
+"""
+Magic bitboard lookup for sliding pieces.
+The attack tables are built once from the magic numbers below, cached on disk
+and memory-mapped on every later start.
+"""
+import mmap
+import os
+import random
+import tempfile
+from array import array
+
+FULL = (1 << 64) - 1
+
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "sliding_attacks.bin")
+
+# Found with find_magic(sq, directions, random.Random(2024)), rooks first
+ROOK_MAGICS = (
+    0x2080001440022581, 0x1080200040001080, 0x4080100008200080, 0x0280080080100254,
+    0x4D8004000A180080, 0x0100080400020100, 0x1080010040800200, 0x0200004402002081,
+    0x0068800024884004, 0x1000804000802002, 0x000200208A001040, 0x3008801000800800,
+    0x2006001060440A00, 0x1000800200800400, 0x0004000441024810, 0xA001000082004100,
+    0x0040808000204014, 0x0000424002201000, 0x0010110041002000, 0x0000090021041000,
+    0x0204008004800800, 0x0000808004000200, 0x6006040021485042, 0x0000020002409924,
+    0x2000401980028020, 0x4000400100308100, 0x0000820200201041, 0xB100100080800800,
+    0x3004080080040080, 0x0802000200041009, 0x01A0580400021110, 0x00020042000408A1,
+    0x4218884000800023, 0x0480201000400045, 0x0010200080801000, 0x1200200901001000,
+    0x0000100801000500, 0x0080020080800400, 0x004A000100404080, 0x0480005402001081,
+    0x258000402000C000, 0xA010004820084002, 0x0480200010008080, 0x244100100021000C,
+    0x2040080005010010, 0x0012000810020004, 0x0011000200B9000C, 0x1121000080410002,
+    0x00082080410A0600, 0x4002008100402600, 0x0A0300E008544100, 0x7B00080010008080,
+    0x0300080100100500, 0x0002020080040080, 0x0042521810214400, 0x8A00004089140200,
+    0x00001280010A2041, 0x0400401102042086, 0x41902000100C4101, 0x0043020420900009,
+    0x00E2000410082002, 0x4402000108041002, 0x2100101A00814804, 0x0400010400218246,
+)
+
+BISHOP_MAGICS = (
+    0x0102040418220020, 0x0108024802002028, 0x8010044040400001, 0x0022209200044800,
+    0x4004504005040114, 0x0022010420A80800, 0x0008441008090002, 0x0000420801480200,
+    0x1100220244011C00, 0x00883004081AB020, 0x4400100152002000, 0x4019080841004000,
+    0x2861021210000000, 0x400EA10108400020, 0x4800208208A24000, 0x0020A500A0842085,
+    0x3410000802504400, 0x0010E0200C010060, 0x0014182042408200, 0x4094006840112109,
+    0x2014200202010000, 0x000100020080C400, 0x800400420D2C0200, 0x0002200182251000,
+    0x0010F10304C41000, 0x001024A008281084, 0x0088110002040100, 0x0820080001004008,
+    0x0104040020410050, 0x0110002027040500, 0x418C008009182100, 0x2C00A9040C80480B,
+    0x008110C8005020A4, 0x4004210802041000, 0x0004020108208100, 0x0000080800120A00,
+    0x430C008400820102, 0x1400808100020108, 0x005006020010A8A0, 0x000801868004A220,
+    0x00420105C00C2000, 0x1010921032019040, 0x0300222028103000, 0x0008004208001080,
+    0x5410202248811400, 0x0008010800800808, 0x3C02C20404000900, 0x0408022282040032,
+    0x0000941002100000, 0x0112209A10100804, 0x080C020111210000, 0x442002A442022008,
+    0x00084A181B040000, 0x00115021021C2080, 0x4010051000A20000, 0x0404688085060000,
+    0x0000220110011000, 0x140000220734200C, 0x0440010424020800, 0x2204828883460800,
+    0x0020000004050410, 0x4060004A20082080, 0x00489034B002C201, 0x0444049010410300,
+)
+
+
+def sliding_attacks(sq, occupied, directions):
+    # Walk every ray until it leaves the board or hits a piece
+    attacks = 0
+    x, y = divmod(sq, 8)
+    for dx, dy in directions:
+        new_x, new_y = x + dx, y + dy
+        while 0 <= new_x < 8 and 0 <= new_y < 8:
+            bit = 1 << (new_x * 8 + new_y)
+            attacks |= bit
+            if occupied & bit: break
+            new_x, new_y = new_x + dx, new_y + dy
+    return attacks
+
+def relevant_mask(sq, directions):
+    # Squares whose occupancy matters, the last square of every ray never blocks anything
+    mask = 0
+    x, y = divmod(sq, 8)
+    for dx, dy in directions:
+        new_x, new_y = x + dx, y + dy
+        while 0 <= new_x + dx < 8 and 0 <= new_y + dy < 8:
+            mask |= 1 << (new_x * 8 + new_y)
+            new_x, new_y = new_x + dx, new_y + dy
+    return mask
+
+def occupancy_subsets(mask):
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if not subset: break
+
+def find_magic(sq, directions, rng: random.Random):
+    """ Trial and error search for a collision-free magic, slow (~1 min for all rooks) """
+    mask = relevant_mask(sq, directions)
+    shift = 64 - bin(mask).count("1")
+    occupancies = list(occupancy_subsets(mask))
+    attacks = [sliding_attacks(sq, occupied, directions) for occupied in occupancies]
+
+    while True:
+        magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        if bin((mask * magic) & 0xFF00000000000000).count("1") < 6: continue
+        table = {}
+        for occupied, attack in zip(occupancies, attacks):
+            index = ((occupied * magic) & FULL) >> shift
+            if table.setdefault(index, attack) != attack: break
+        else:
+            return magic
+
+
+def build_tables():
+    # Layout: 128 magics as a header, then every square's rook table, then every square's bishop table
+    table = array("Q", ROOK_MAGICS + BISHOP_MAGICS)
+    for magics, directions in ((ROOK_MAGICS, ROOK_DIRECTIONS), (BISHOP_MAGICS, BISHOP_DIRECTIONS)):
+        for sq in range(64):
+            mask = relevant_mask(sq, directions)
+            shift = 64 - bin(mask).count("1")
+            start = len(table)
+            table.frombytes(bytes(8 << (64 - shift)))
+            for occupied in occupancy_subsets(mask):
+                table[start + (((occupied * magics[sq]) & FULL) >> shift)] = sliding_attacks(sq, occupied, directions)
+    return table
+
+def table_size():
+    # Entries of build_tables: the header and 2^bits per square for each piece
+    return 128 + sum(1 << bin(relevant_mask(sq, directions)).count("1") for directions in (ROOK_DIRECTIONS, BISHOP_DIRECTIONS) for sq in range(64))
+
+def load_tables(path=CACHE_PATH):
+    # Memory-map the cached tables, rebuild the cache if it is missing, truncated or was built from other magics
+    expected = array("Q", ROOK_MAGICS + BISHOP_MAGICS).tobytes()
+    try:
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) == 8 * table_size() and mapped[:len(expected)] == expected: return memoryview(mapped).cast("Q")
+        mapped.close()
+    except (OSError, ValueError):
+        pass
+
+    table = build_tables()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temporary file of its own, processes building the cache at the same time don't write into each other's
+        file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False)
+        try:
+            with file: table.tofile(file)
+            # Temporary files are private, the cache is readable like any other file
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, path)
+        except OSError:
+            os.remove(file.name)
+            raise
+    except OSError:
+        # Read-only install, keep the tables in memory
+        return table
+    return load_tables(path)
+
+
+def _layout(directions, offset):
+    masks, shifts, offsets = [], [], []
+    for sq in range(64):
+        mask = relevant_mask(sq, directions)
+        masks.append(mask)
+        shifts.append(64 - bin(mask).count("1"))
+        offsets.append(offset)
+        offset += 1 << (64 - shifts[-1])
+    return masks, shifts, offsets, offset
+
+ROOK_MASKS, ROOK_SHIFTS, ROOK_OFFSETS, _rooks_end = _layout(ROOK_DIRECTIONS, 128)
+BISHOP_MASKS, BISHOP_SHIFTS, BISHOP_OFFSETS, _ = _layout(BISHOP_DIRECTIONS, _rooks_end)
+TABLE = load_tables()
+
+
+def rook_attacks(sq, occupied):
+    return TABLE[ROOK_OFFSETS[sq] + ((((occupied & ROOK_MASKS[sq]) * ROOK_MAGICS[sq]) & FULL) >> ROOK_SHIFTS[sq])]
+
+def bishop_attacks(sq, occupied):
+    return TABLE[BISHOP_OFFSETS[sq] + ((((occupied & BISHOP_MASKS[sq]) * BISHOP_MAGICS[sq]) & FULL) >> BISHOP_SHIFTS[sq])]
@@ -1,40 +1,265 @@
+import sys
+import uuid
+
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from board import BoardCell, Board
+import profiling
+from analysis import BackgroundAnalysis
+from book import OpeningBook, BOOK_PATH
+from board import BoardCell, Board, get_analysis_cache
+from core import COLORS, WHITE, CHECKMATE, STALEMATE, THREEFOLD_REPETITION, FIFTY_MOVES, INSUFFICIENT_MATERIAL, move_to_uci
+from engine import Engine, MATE, MAX_PLY
+from gamestore import GameStore, DB_PATH
+from parallel import ParallelEngine, PREFORKED, prefork
+from pgn import move_to_san
 from pieces import *
+from profiling import Profiler
+from tablebase import Tablebases, DRAW, dtm_plies
+
+WORKER_COUNTS = (1, 2, 4, 8)
+
+if get_script_run_ctx(suppress_warning=True) is None:
+    # Started as `python main.py [streamlit options]`: fork the worker pools while this process has a single
+    # thread, then serve this file from the same process, where get_parallel_engine finds them
+    try: book = OpeningBook(BOOK_PATH)
+    except (FileNotFoundError, ValueError): book = None
+    prefork([workers for workers in WORKER_COUNTS if workers > 1], book=book, tablebases=Tablebases())
+    from streamlit.web import cli
+    sys.argv = ["streamlit", "run", __file__, *sys.argv[1:]]
+    sys.exit(cli.main())
 
-# TODO: En passant capture (movement is done)
-# TODO: Castling
-# TODO: Pawn promotion
+# TODO: Pawn promotion choice (always promotes to a queen)
 # TODO: Reverse board view (black at the bottom (at the top of the screen))
 
 if "game" not in st.session_state:
     print("NOVÁ HRA")
     st.session_state.game = Board()
 
-if "whites_turn" not in st.session_state:
-    st.session_state.whites_turn = True
-
 if "active_piece" not in st.session_state:
     st.session_state.active_piece = None
 
 if "legal_moves" not in st.session_state:
     st.session_state.legal_moves = []
 
-if "all_legal_moves" not in st.session_state:
-    st.session_state.all_legal_moves = []
+@st.cache_resource
+def get_opening_book():
+    # Built with `python book.py build`, the app plays without one
+    try: return OpeningBook(BOOK_PATH)
+    except (FileNotFoundError, ValueError): return None
+
+@st.cache_resource
+def get_tablebases():
+    # Built with `python tablebase.py build`, missing tables are just not probed
+    return Tablebases()
+
+if "profiler" not in st.session_state:
+    st.session_state.profiler = Profiler()
+    st.session_state.session_id = uuid.uuid4().hex[:8]
+
+# Measure the whole rerun when the debug toggle is on
+if st.session_state.get("profiling"): st.session_state.profiler.begin(scope="app", session=st.session_state.session_id)
+
+@st.cache_resource
+def get_parallel_engine(workers):
+    # One worker pool per size, shared by every session and reused across moves.
+    # `python main.py` forks them all before the server starts. Under `streamlit run` a pool is forked here,
+    # from a session thread while the server's other threads keep running: a lock one of them held at that
+    # moment stays locked in the child. The workers only run the engine, which takes no locks
+    if workers in PREFORKED: return PREFORKED[workers]
+    return ParallelEngine(workers, book=get_opening_book(), tablebases=get_tablebases())
+
+@st.cache_resource
+def get_game_store():
+    return GameStore(DB_PATH)
+
+with st.sidebar:
+    st.radio("Opponent", ["Human", "Engine"], key="opponent")
+    st.radio("Engine plays", ["black", "white"], key="engine_color", disabled=st.session_state.opponent != "Engine")
+    st.slider("Engine time per move (s)", 0.1, 5.0, 1.0, 0.1, key="engine_time", disabled=st.session_state.opponent != "Engine")
+    st.selectbox("Engine workers", WORKER_COUNTS, key="engine_workers", disabled=st.session_state.opponent != "Engine")
+    st.toggle("Show analysis", key="show_analysis")
+    st.radio("Board", ["Buttons", "Component"], key="board_mode", horizontal=True, help="Component draws the board as one SVG instead of 64 buttons")
+
+# The session's engine and its table only exist while the engine is the opponent
+if st.session_state.opponent == "Engine" and "engine" not in st.session_state:
+    st.session_state.engine = Engine(book=get_opening_book(), tablebases=get_tablebases())
+elif st.session_state.opponent != "Engine":
+    st.session_state.pop("engine", None)
+
+# Engine replies in the rerun that follows the human move, within its time budget
+game = st.session_state.game
+if st.session_state.opponent == "Engine" and game.status is None and COLORS[game.position.turn] == st.session_state.engine_color:
+    workers = st.session_state.engine_workers
+    if workers == 1:
+        engine = st.session_state.engine
+        result = game.play_engine_move(engine, st.session_state.engine_time)
+    else:
+        # The pool is shared, while another session searches on it this one uses its own engine
+        engine = get_parallel_engine(workers)
+        result = game.play_engine_move(engine, st.session_state.engine_time, fallback=st.session_state.engine)
+    if result.best_move is not None:
+        tt_stats = engine.tt.stats()
+        if result.source == "book": st.session_state.engine_info = f"{move_to_uci(result.best_move)}: book move"
+        elif result.source == "tablebase": st.session_state.engine_info = f"{move_to_uci(result.best_move)}: tablebase, score {result.score}"
+        else: st.session_state.engine_info = f"{move_to_uci(result.best_move)}: depth {result.depth}, score {result.score}, {result.nodes} nodes in {result.elapsed:.2f}s, TT hit rate {tt_stats['hit_rate']:.0%}"
+
+if st.session_state.opponent == "Engine" and st.session_state.get("engine_info"):
+    st.sidebar.caption(st.session_state.engine_info)
+
+# Book moves of the current position, heaviest first
+book = get_opening_book()
+if book is not None and game.status is None:
+    book_moves = book.moves(game.position)
+    if book_moves: st.sidebar.caption("Book: " + ", ".join(f"{move_to_san(game.position, move)} ({weight})" for move, weight in book_moves[:5]))
+
+def format_score(score, turn):
+    # Engine scores are for the side to move, show them for white
+    if turn != WHITE: score = -score
+    if abs(score) > MATE - MAX_PLY: return f"{'' if score > 0 else '-'}#{(MATE - abs(score) + 1) // 2}"
+    return f"{score / 100:+.2f}"
+
+def show_analysis(result, finished):
+    if result is None:
+        st.caption("Analysing...")
+        return
+    turn = st.session_state.game.position.turn
+    pv = " ".join(move_to_uci(move) for move in result.pv)
+    st.metric("Evaluation", format_score(result.score, turn))
+    st.caption(f"Depth {result.depth}{'' if finished else '+'}, {result.nodes} nodes: {pv}")
+
+@st.fragment(run_every=0.5)
+def analysis_panel():
+    # Only this fragment reruns while the search thread deepens, the board is not touched
+    result, finished = st.session_state.background_analysis.snapshot()
+    # A finished search shows as a static panel, one full rerun stops the polling
+    if finished: st.rerun()
+    show_analysis(result, finished)
+
+# Analysis runs in the background, the rerun only hands it the current position.
+# Its engine only exists while the analysis is shown
+if st.session_state.show_analysis:
+    if "background_analysis" not in st.session_state: st.session_state.background_analysis = BackgroundAnalysis()
+    st.session_state.background_analysis.analyse(game.position)
+    result, finished = st.session_state.background_analysis.snapshot()
+    with st.sidebar:
+        if finished: show_analysis(result, finished)
+        else: analysis_panel()
+elif "background_analysis" in st.session_state:
+    st.session_state.pop("background_analysis").cancel()
 
-if "pieces_can_move" not in st.session_state:
-    st.session_state.pieces_can_move = []
+@st.fragment
+def board_view():
+    # Selecting a piece reruns only this fragment, the analysis comes from the cache
+    # and the rest of the page stays, a move reruns everything
+    if st.session_state.pop("board_changed", False): st.rerun()
+
+    # A fragment rerun is profiled on its own, inside a full rerun it is already counted
+    own_profile = st.session_state.get("profiling") and not profiling.active()
+    if own_profile: st.session_state.profiler.begin(scope="fragment", session=st.session_state.session_id)
+    st.session_state.game.render()
+    if own_profile: st.session_state.profiler.finish(fen=st.session_state.game.to_fen())
 
 #game.board.reverse()
 print("RENDER")
-st.session_state.game.render()
-
-# Handle game result
-if st.session_state.white_king_in_check and not st.session_state.pieces_can_move:
-    st.warning("Checkmate! Black wins!")
-elif st.session_state.black_king_in_check and not st.session_state.pieces_can_move:
-    st.warning("Checkmate! White wins!")
-elif not st.session_state.pieces_can_move:
-    st.warning("Stalemate!")
\ No newline at end of file
+if st.session_state.board_mode == "Component":
+    if game.render_component():
+        if "background_analysis" in st.session_state: st.session_state.background_analysis.cancel()
+        st.rerun()
+else:
+    board_view()
+
+def take_back():
+    game = st.session_state.game
+    game.take_back()
+    # Against the engine take back its reply and the human move before it
+    if st.session_state.opponent == "Engine" and game.status is None and COLORS[game.position.turn] == st.session_state.engine_color: game.take_back()
+    st.session_state.active_piece = None
+    st.session_state.legal_moves = []
+
+st.button("Take back", disabled=not st.session_state.game.history, on_click=take_back)
+
+@st.fragment
+def history_view():
+    # Scrubbing reruns only this fragment, every ply is at most one snapshot interval of replay away
+    game = st.session_state.game
+    history = game.history
+    if not history:
+        st.caption("No moves yet")
+        return
+
+    # Without a key the slider jumps back to the latest ply whenever a move is added
+    ply = st.slider("Ply", 0, len(history), len(history))
+    if ply: st.caption(f"{(ply + 1) // 2}.{'' if ply % 2 else '..'} {move_to_uci(history.moves[ply - 1])}")
+    if ply == len(history): return
+
+    Board(history.position_at(ply)).render_component(key="history_preview", interactive=False)
+    if st.button("Continue from here"):
+        game.rewind(ply)
+        st.session_state.active_piece = None
+        st.session_state.legal_moves = []
+        st.rerun()
+
+with st.expander("History"):
+    history_view()
+
+with st.expander("Stored games with this position"):
+    games = get_game_store().games_with_position(st.session_state.game.hash, limit=20)
+    if not games: st.caption("None yet")
+    for game_id, ply, white, black, result in games: st.caption(f"Game {game_id}, ply {ply}: {white} - {black} {result}")
+
+def load_fen():
+    try:
+        st.session_state.game = Board.from_fen(st.session_state.fen_input)
+    except ValueError as error:
+        st.session_state.fen_error = str(error)
+        return
+    st.session_state.fen_error = None
+    st.session_state.active_piece = None
+    st.session_state.legal_moves = []
+
+with st.expander("Position"):
+    st.code(st.session_state.game.to_fen(), language=None)
+    st.text_input("FEN", key="fen_input")
+    st.button("Load", on_click=load_fen)
+    if st.session_state.get("fen_error"): st.error(st.session_state.fen_error)
+    cache_stats = get_analysis_cache().stats()
+    st.caption(f"Shared analysis cache: {cache_stats['entries']} positions, {cache_stats['bytes'] / 1024:.0f} KiB, hit rate {cache_stats['hit_rate']:.0%}")
+
+# Handle game result, computed once per move by the board
+game = st.session_state.game
+
+# Finished games are kept in the local store, once per final position, a loaded finished position is no game
+if game.status is not None and game.history and st.session_state.get("saved_game") != (id(game), len(game.history)):
+    players = {color: "Engine" if st.session_state.opponent == "Engine" and st.session_state.engine_color == color else "Human" for color in COLORS}
+    result = {"white": "1-0", "black": "0-1"}.get(game.winner, "1/2-1/2")
+    get_game_store().add_game(game.history.moves, game.history.position_at(0).to_fen(), result, players["white"], players["black"])
+    st.session_state.saved_game = (id(game), len(game.history))
+if game.status == CHECKMATE:
+    st.warning(f"Checkmate! {game.winner.capitalize()} wins!")
+elif game.status == STALEMATE:
+    st.warning("Stalemate!")
+elif game.status == THREEFOLD_REPETITION:
+    st.warning("Draw by threefold repetition!")
+elif game.status == FIFTY_MOVES:
+    st.warning("Draw by the fifty-move rule!")
+elif game.status == INSUFFICIENT_MATERIAL:
+    st.warning("Draw by insufficient material!")
+else:
+    # Solved endings show the exact outcome straight away
+    value = get_tablebases().probe(game.position)
+    if value == DRAW: st.info("Tablebase: draw with best play")
+    elif value is not None:
+        winner = COLORS[game.position.turn if value > 0 else 1 - game.position.turn]
+        st.info(f"Tablebase: {winner} mates in {(dtm_plies(value) + 1) // 2} with best play")
+
+# Debug sidebar, the record of this rerun closes here so the panel itself is not measured
+with st.sidebar:
+    st.toggle("Profiling", key="profiling", help="Record render time, position queries and widgets per rerun")
+    if st.session_state.profiling:
+        profiler = st.session_state.profiler
+        profiler.finish(fen=st.session_state.game.to_fen())
+        if profiler.records: st.json(profiler.records[-1], expanded=False)
+        st.download_button("Export JSON lines", profiler.to_jsonl(), file_name=f"profile_{st.session_state.session_id}.jsonl", mime="application/jsonl", disabled=not profiler.records)
+    else:
+        st.session_state.profiler.discard()
@@ -0,0 +1,147 @@
+"""
+Lazy SMP: the same iterative deepening search runs in a pool of worker processes that share
+one transposition table in shared memory, so every worker profits from what the others found.
+The pool and the table live as long as the ParallelEngine and are reused for every move.
+
+    python parallel.py   # nodes per second with 1, 2, 4 and 8 workers
+"""
+import argparse
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from core import Position
+from engine import Engine, SearchResult, MAX_PLY, tablebase_score
+from tt import TranspositionTable, table_bytes
+
+# Per worker process: the attached shared memory (the table is a view into it) and the engine
+_shared = None
+_engine = None
+# Engines created by prefork, by worker count
+PREFORKED = {}
+
+
+def reversible_history(position: Position):
+    """ (bytes of the position before the last capture or pawn move, moves played since), all a repetition can reach """
+    plies = min(position.halfmove_clock, len(position.undo_stack))
+    start = position.copy()
+    for _ in range(plies): start.unmake_move()
+    return start.to_bytes(), [entry[0] for entry in position.undo_stack[len(position.undo_stack) - plies:]]
+
+def _init_worker(shared_name, tt_size_mb, tablebase_dir):
+    global _shared, _engine
+    _shared = shared_memory.SharedMemory(name=shared_name)
+    tablebases = None
+    if tablebase_dir is not None:
+        # Every worker maps the table files itself, the pages are shared through the page cache
+        from tablebase import Tablebases
+        tablebases = Tablebases(tablebase_dir)
+    _engine = Engine(tt=TranspositionTable(tt_size_mb, _shared.buf), tablebases=tablebases)
+
+def _search_worker(position_bytes, moves, index, time_limit, node_limit, max_depth):
+    # Replay the moves on top of the sent position, the undo stack then holds the hashes repetitions look at
+    position = Position.from_bytes(position_bytes)
+    for move in moves: position.make_move(move)
+
+    # Odd helpers start one ply deeper, so the workers do not all search the same tree in step
+    tt = _engine.tt
+    hits, misses = tt.hits, tt.misses
+    result = _engine.search(position, time_limit=time_limit, node_limit=node_limit,
+                            max_depth=max_depth, start_depth=1 + index % 2)
+    return result.best_move, result.score, result.depth, result.nodes, result.pv, tt.hits - hits, tt.misses - misses
+
+
+class ParallelEngine:
+    def __init__(self, workers=4, tt_size_mb=32, book=None, tablebases=None):
+        self.workers = workers
+        # Probed here so book and tablebase moves never reach the pool, the workers probe the tablebases inside the tree
+        self.book = book  # book.OpeningBook
+        self.tablebases = tablebases  # tablebase.Tablebases
+        self.shared = shared_memory.SharedMemory(create=True, size=table_bytes(tt_size_mb))
+        # Forked workers: spawned ones would re-run the Streamlit script, which Streamlit registers as __main__.
+        # Workers only run the engine, so none of the server's threads are needed in them.
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                        initializer=_init_worker, initargs=(self.shared.name, tt_size_mb, tablebases.directory if tablebases is not None else None))
+        # A fork pool starts all its workers on the first task, do it now rather than in the middle of a search
+        self.pool.submit(int).result()
+        self.tt = TranspositionTable(tt_size_mb, self.shared.buf)
+        self.lock = threading.Lock()
+        # Pools cached for the server's lifetime are never closed explicitly
+        atexit.register(self.close)
+
+    def search(self, position: Position, time_limit=1.0, node_limit=None, max_depth=MAX_PLY, fallback=None):
+        """
+        Same budget semantics as Engine.search, node_limit is split between the workers. While another
+        caller has the pool the search runs on fallback (an Engine) if given, rather than waiting its turn
+        """
+        start = time.perf_counter()
+        if self.book is not None:
+            book_move = self.book.choose(position)
+            if book_move is not None: return SearchResult(book_move, elapsed=time.perf_counter() - start, pv=[book_move], source="book")
+        if self.tablebases is not None:
+            best = self.tablebases.best_move(position)
+            if best is not None: return SearchResult(best[0], tablebase_score(best[1], 0), elapsed=time.perf_counter() - start, pv=[best[0]], source="tablebase")
+
+        position_bytes, moves = reversible_history(position)
+        worker_nodes = node_limit // self.workers if node_limit else None
+
+        if not self.lock.acquire(blocking=fallback is None):
+            return fallback.search(position, time_limit=time_limit, node_limit=node_limit, max_depth=max_depth)
+        try:
+            futures = [self.pool.submit(_search_worker, position_bytes, moves, index, time_limit, worker_nodes, max_depth)
+                       for index in range(self.workers)]
+            results = [future.result() for future in futures]
+        finally:
+            self.lock.release()
+
+        # The deepest completed search wins, worker 0 on ties
+        best_move, score, depth, _, pv, _, _ = max(results, key=lambda result: result[2])
+        nodes = sum(result[3] for result in results)
+        # Table counters live in the workers, collect them here so tt.stats() covers the pool
+        self.tt.hits += sum(result[5] for result in results)
+        self.tt.misses += sum(result[6] for result in results)
+        return SearchResult(best_move, score, depth, nodes, time.perf_counter() - start, pv)
+
+    def close(self):
+        if self.tt is None: return
+        self.pool.shutdown()
+        self.tt = None
+        self.shared.close()
+        self.shared.unlink()
+        atexit.unregister(self.close)
+
+
+def prefork(worker_counts, **options):
+    """ Create the engines for these worker counts now, while the process has one thread and forking is safe """
+    for workers in worker_counts:
+        if workers not in PREFORKED: PREFORKED[workers] = ParallelEngine(workers, **options)
+
+
+def benchmark(worker_counts=(1, 2, 4, 8), time_limit=2.0, fen=None):
+    """ Nodes per second with every worker count, relative to one worker """
+    position = Position(fen) if fen else Position("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    baseline = None
+    for workers in worker_counts:
+        engine = ParallelEngine(workers)
+        try:
+            # Warm up the pool so process start-up is not counted
+            engine.search(position, time_limit=0.1)
+            engine.tt.clear()
+            result = engine.search(position, time_limit=time_limit)
+        finally:
+            engine.close()
+        nps = result.nodes / result.elapsed
+        baseline = baseline or nps
+        print(f"{workers} worker(s): {result.nodes:>8} nodes {result.elapsed:6.2f}s {nps:>10,.0f} nps  x{nps / baseline:.2f}  depth {result.depth}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure Lazy SMP nodes per second scaling.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--time", type=float, default=2.0, help="seconds per search")
+    parser.add_argument("--fen")
+    args = parser.parse_args()
+    benchmark(args.workers, args.time, args.fen)
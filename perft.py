@@ -0,0 +1,96 @@
+"""
+Perft: count leaf nodes of the legal move tree to check and benchmark move generation.
+
+    python perft.py                          # reference suite up to depth 3
+    python perft.py --depth 5 --fen "<FEN>"  # one position
+    python perft.py --depth 3 --divide       # node count per root move
+"""
+import argparse
+import sys
+import time
+
+from core import Position, STARTING_FEN, move_to_uci
+
+# Reference positions with their known node counts per depth, starting at depth 1
+REFERENCE_POSITIONS = [
+    ("startpos", STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(position: Position, depth):
+    if depth == 0: return 1
+    moves = position.legal_moves()
+    # Bulk counting, the last ply only needs the number of moves
+    if depth == 1: return len(moves)
+
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+def divide(position: Position, depth):
+    # Node count below every root move, for comparing against another engine
+    counts = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+def timed_perft(fen, depth):
+    position = Position(fen)
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    return nodes, time.perf_counter() - start
+
+def run_suite(max_depth):
+    failures = 0
+    for name, fen, expected in REFERENCE_POSITIONS:
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            nodes, elapsed = timed_perft(fen, depth)
+            status = "OK" if nodes == expected[depth - 1] else f"FAIL (expected {expected[depth - 1]})"
+            if nodes != expected[depth - 1]: failures += 1
+            print(f"{name:<10} depth {depth}: {nodes:>9} nodes {elapsed:8.3f}s {nodes / max(elapsed, 1e-9):>10,.0f} nps  {status}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time legal move tree leaves.")
+    parser.add_argument("--fen", help="position to count, runs the reference suite when omitted")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    args = parser.parse_args(argv)
+
+    if args.depth < 1: parser.error("--depth must be at least 1")
+
+    if args.fen is None and not args.divide:
+        failures = run_suite(args.depth)
+        if failures: print(f"{failures} count(s) differ from the reference")
+        return 1 if failures else 0
+
+    fen = args.fen or STARTING_FEN
+    try: position = Position(fen)
+    except ValueError as error: parser.error(str(error))
+
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for uci, nodes in sorted(counts.items()): print(f"{uci}: {nodes}")
+        nodes = sum(counts.values())
+        print(f"\nMoves: {len(counts)}")
+    else:
+        nodes = perft(position, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"Nodes: {nodes}  Time: {elapsed:.3f}s  NPS: {nodes / max(elapsed, 1e-9):,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Streaming PGN reader and batch replay of games against the rules in core.py.
+Files are read line by line and games are replayed in chunks across a process pool,
+so archives of any size run in constant memory.
+
+    python pgn.py games.pgn [more.pgn ...] --workers 4 --output results.jsonl [--evaluate]
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from core import Position, STARTING_FEN, PIECE_SYMBOLS, PAWN, KING, square, square_name, piece_type, move_from, move_to, move_promotion
+
+SAN_PATTERN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?")
+# Comments, variation brackets, NAGs, results and everything else as one token each
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|[()]|[^\s(){};]+")
+MOVE_NUMBER = re.compile(r"^\d+\.+")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+
+
+def parse_square(name):
+    return square(int(name[1]) - 1, ord(name[0]) - ord("a"))
+
+def parse_san(position: Position, san, legal_moves=None):
+    """ The legal move written as san, raises ValueError when there is none or it is ambiguous """
+    if legal_moves is None: legal_moves = position.legal_moves()
+    token = san.rstrip("+#!?")
+
+    if token in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        king = position.king_square(position.turn)
+        target = king + (2 if len(token) == 3 else -2)
+        candidates = [move for move in legal_moves if move_from(move) == king and move_to(move) == target]
+    else:
+        match = SAN_PATTERN.fullmatch(token)
+        if match is None: raise ValueError(f"Invalid SAN: {san}")
+        symbol, from_file, from_rank, to_name, promotion = match.groups()
+        kind = PIECE_SYMBOLS.index(symbol) if symbol else PAWN
+        to_sq = parse_square(to_name)
+        promotion = PIECE_SYMBOLS.index(promotion) if promotion else 0
+        candidates = [
+            move for move in legal_moves
+            if move_to(move) == to_sq and piece_type(position.squares[move_from(move)]) == kind and move_promotion(move) == promotion
+            and (from_file is None or move_from(move) % 8 == ord(from_file) - ord("a"))
+            and (from_rank is None or move_from(move) // 8 == int(from_rank) - 1)
+        ]
+
+    if not candidates: raise ValueError(f"Illegal move: {san}")
+    if len(candidates) > 1: raise ValueError(f"Ambiguous move: {san}")
+    return candidates[0]
+
+def move_to_san(position: Position, move, legal_moves=None):
+    """ Standard algebraic notation of a legal move, with + or # """
+    if legal_moves is None: legal_moves = position.legal_moves()
+    from_sq, to_sq, promotion = move_from(move), move_to(move), move_promotion(move)
+    kind = piece_type(position.squares[from_sq])
+    capture = position.squares[to_sq] is not None or (kind == PAWN and to_sq == position.ep_square)
+
+    if kind == KING and abs(to_sq - from_sq) == 2:
+        san = "O-O" if to_sq > from_sq else "O-O-O"
+    elif kind == PAWN:
+        san = (square_name(from_sq)[0] + "x" if capture else "") + square_name(to_sq)
+        if promotion: san += "=" + PIECE_SYMBOLS[promotion]
+    else:
+        # Disambiguate by file, then rank, then both
+        others = [other for other in legal_moves if other != move and move_to(other) == to_sq and position.squares[move_from(other)] == position.squares[from_sq]]
+        origin = ""
+        if others:
+            if all(move_from(other) % 8 != from_sq % 8 for other in others): origin = square_name(from_sq)[0]
+            elif all(move_from(other) // 8 != from_sq // 8 for other in others): origin = square_name(from_sq)[1]
+            else: origin = square_name(from_sq)
+        san = PIECE_SYMBOLS[kind] + origin + ("x" if capture else "") + square_name(to_sq)
+
+    position.make_move(move)
+    if position.is_check(): san += "#" if not position.legal_moves() else "+"
+    position.unmake_move()
+    return san
+
+
+class PgnGame:
+    def __init__(self, index, headers, moves, result):
+        self.index = index
+        self.headers = headers
+        self.moves = moves  # SAN
+        self.result = result
+
+
+def read_games(lines):
+    """ Yields every game of a PGN text given as an iterable of lines, one game in memory at a time """
+    index = 0
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        match = HEADER_PATTERN.match(line)
+        if match:
+            # A header after movetext starts the next game
+            if movetext:
+                yield _parse_game(index, headers, movetext)
+                index += 1
+                headers, movetext = {}, []
+            headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith("%"):
+            movetext.append(line)
+    if headers or movetext: yield _parse_game(index, headers, movetext)
+
+def _parse_game(index, headers, movetext):
+    moves = []
+    result = headers.get("Result", "*")
+    depth = 0
+    for token in TOKEN_PATTERN.findall("\n".join(movetext)):
+        if token == "(": depth += 1
+        elif token == ")": depth -= 1
+        elif depth or token[0] in "{;$": continue
+        elif token in RESULTS: result = token
+        else:
+            token = MOVE_NUMBER.sub("", token)
+            if token: moves.append(token)
+    return PgnGame(index, headers, moves, result)
+
+def read_pgn(paths):
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as file:
+            yield from read_games(file)
+
+
+def replay_game(game: PgnGame):
+    """ Play the game through the rules, the result is a plain dict for JSON lines output """
+    record = {"index": game.index, "white": game.headers.get("White"), "black": game.headers.get("Black"), "result": game.result}
+    try:
+        position = Position(game.headers.get("FEN", STARTING_FEN))
+    except ValueError as error:
+        return {**record, "plies": 0, "final_fen": None, "status": None, "error": str(error)}
+
+    for ply, san in enumerate(game.moves):
+        try: move = parse_san(position, san)
+        except ValueError as error:
+            return {**record, "plies": ply, "final_fen": position.to_fen(), "status": None, "error": f"ply {ply + 1}: {error}"}
+        position.make_move(move)
+    return {**record, "plies": len(game.moves), "final_fen": position.to_fen(), "status": position.status(), "error": None}
+
+def _replay_chunk(games, evaluate=False):
+    results = [replay_game(game) for game in games]
+    if evaluate:
+        # Static scores of all final positions of the chunk in one NumPy batch, for white
+        from batch_eval import evaluate_batch, encode_positions
+
+        finished = [result for result in results if result["final_fen"]]
+        if finished:
+            scores = evaluate_batch(encode_positions([Position(result["final_fen"]) for result in finished])[0])
+            for result, score in zip(finished, scores.tolist()): result["eval"] = score
+    return results
+
+def replay_games(games, workers=4, chunk_size=64, evaluate=False):
+    """ Yields one result per game in input order, only a few chunks are in flight at a time """
+    def chunks():
+        chunk = []
+        for game in games:
+            chunk.append(game)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk: yield chunk
+
+    if workers <= 1:
+        for chunk in chunks(): yield from _replay_chunk(chunk, evaluate)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(pool.submit(_replay_chunk, chunk, evaluate))
+            if len(pending) >= 2 * workers: yield from pending.popleft().result()
+        while pending: yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay PGN games against the rules and report throughput.")
+    parser.add_argument("paths", nargs="+", help="PGN files")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=64, help="games per task sent to a worker")
+    parser.add_argument("--output", help="write one JSON result per game to this file")
+    parser.add_argument("--evaluate", action="store_true", help="add a static evaluation of every final position (needs numpy)")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else None
+    games = errors = 0
+    start = time.perf_counter()
+    try:
+        for result in replay_games(read_pgn(args.paths), args.workers, args.chunk_size, args.evaluate):
+            games += 1
+            if result["error"]:
+                errors += 1
+                # Only the first errors on the terminal, all of them are in the output file
+                if errors <= 10: print(f"game {result['index']}: {result['error']}", file=sys.stderr)
+            if output: output.write(json.dumps(result) + "\n")
+    finally:
+        if output: output.close()
+    elapsed = time.perf_counter() - start
+    print(f"Games: {games}  Errors: {errors}  Time: {elapsed:.2f}s  Games/s: {games / max(elapsed, 1e-9):,.1f}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Process-wide LRU cache of per-position results keyed by the Zobrist hash.
+Streamlit sessions run as threads of one process, so a single instance (st.cache_resource)
+serves every session and popular positions skip move generation entirely.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value, seen=None):
+    # Rough deep size of plain data: containers, objects with __dict__ and scalars
+    if seen is None: seen = set()
+    if id(value) in seen: return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict): size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)): size += sum(estimate_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"): size += estimate_size(vars(value), seen)
+    return size
+
+
+class PositionCache:
+    def __init__(self, max_entries=50_000, max_bytes=64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # hash -> (value, size), oldest first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None: self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+
+            # Evict least recently used entries until both limits hold again
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """ Cached value for key, compute() runs outside the lock on a miss """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
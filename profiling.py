@@ -0,0 +1,73 @@
+"""
+Optional per-rerun instrumentation: wall time of the rerun and the board render, call counts
+of the position queries made by the UI, positions analysed and board widgets. Counters live in a
+thread local and every Streamlit session reruns in its own thread, so sessions don't mix.
+The counting points are explicit calls in board.py; core.py and the engine are never wrapped,
+so outside a profiled rerun a counting point costs one thread local lookup.
+"""
+import functools
+import json
+import threading
+import time
+from collections import Counter, deque
+
+
+_local = threading.local()
+
+
+def active():
+    return getattr(_local, "counts", None) is not None
+
+def count(name, n=1):
+    counts = getattr(_local, "counts", None)
+    if counts is not None: counts[name] += n
+
+def timed(name):
+    """ Adds the wall time of the function in ms to name, a plain call when nothing is profiled """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not active(): return function(*args, **kwargs)
+            start = time.perf_counter()
+            try: return function(*args, **kwargs)
+            finally: count(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+class Profiler:
+    def __init__(self, max_records=500):
+        self.records = deque(maxlen=max_records)
+        self._start = None
+        self._fields = None
+
+    def begin(self, **fields):
+        # st.rerun() ends a run before finish, the run it starts continues the same record
+        if self._start is not None and active(): return
+        _local.counts = Counter()
+        self._fields = fields
+        self._start = time.perf_counter()
+
+    def finish(self, **fields):
+        """ Close the rerun started by begin and keep its record """
+        if self._start is None or not active(): return None
+        counts = _local.counts
+        _local.counts = None
+
+        record = {"time": round(time.time(), 3), **self._fields, **fields, "wall_ms": round((time.perf_counter() - self._start) * 1000, 2)}
+        record["render_ms"] = round(counts.pop("render_ms", 0.0), 2)
+        record.update(sorted(counts.items()))
+        self.records.append(record)
+        self._start = None
+        return record
+
+    def discard(self):
+        """ Drop the open record, when profiling was switched off before finish """
+        _local.counts = None
+        self._start = None
+
+    def clear(self):
+        self.records.clear()
+
+    def to_jsonl(self):
+        return "".join(json.dumps(record) + "\n" for record in self.records)
@@ -0,0 +1,230 @@
+"""
+Endgame tablebases for king and one piece against a bare king (KQK, KRK, KPK), solved by
+retrograde analysis with NumPy and stored as dense int16 arrays of distance to mate.
+
+A table has the shape (2, 64, 64, 64), indexed by [side to move][strong king][weak king][piece],
+side to move 0 is the strong side. Positions with the piece on black's side are mirrored first.
+A value is 0 for a draw, otherwise plies to mate + 1, positive when the side to move mates
+and negative when it gets mated. Tables are built once and memory-mapped when probed.
+
+    python tablebase.py build             # writes .cache/tablebases/kqk.npy, krk.npy, kpk.npy
+    python tablebase.py probe --fen "<FEN>"
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from core import Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, iter_squares, lsb_square, piece_color, piece_type, move_to_uci
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tablebases")
+# Solved in this order, pawn promotions look up the queen and rook tables
+TABLES = {"kqk": QUEEN, "krk": ROOK, "kpk": PAWN}
+SIZE = 64 * 64 * 64
+DRAW = 0
+
+QUEEN_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = QUEEN_DIRECTIONS[:4]
+
+
+def dtm_plies(value):
+    return abs(value) - 1
+
+def _square_tables(kind):
+    king_targets = np.full((64, 8), -1, np.int32)
+    adjacent = np.zeros((64, 64), bool)
+    for sq in range(64):
+        for i, target in enumerate(iter_squares(KING_ATTACKS[sq])):
+            king_targets[sq, i] = target
+            adjacent[sq, target] = True
+
+    # Squares the piece attacks on an empty board and the squares in between
+    lines = np.zeros((64, 64), bool)
+    between = np.zeros((64, 64, 64), bool)
+    directions = QUEEN_DIRECTIONS if kind == QUEEN else ROOK_DIRECTIONS
+    rays = np.full((64, len(directions), 7), -1, np.int32)
+    for sq in range(64):
+        x, y = divmod(sq, 8)
+        for d, (dx, dy) in enumerate(directions):
+            for step in range(1, 8):
+                tx, ty = x + dx * step, y + dy * step
+                if not (0 <= tx < 8 and 0 <= ty < 8): break
+                rays[sq, d, step - 1] = tx * 8 + ty
+        if kind == PAWN:
+            for target in iter_squares(PAWN_ATTACKS[WHITE][sq]): lines[sq, target] = True
+        else:
+            for target in rays[sq][rays[sq] >= 0]:
+                lines[sq, target] = True
+                for s in iter_squares(BETWEEN[sq][target]): between[sq, target, s] = True
+    return king_targets, adjacent, lines, between, rays
+
+def solve(kind, promotions=None):
+    """
+    DTM table for the strong side playing kind, promotions maps a piece type to the black-to-move
+    half of its solved table (needed for pawns)
+    """
+    king_targets, adjacent, lines, between, rays = _square_tables(kind)
+    index = np.arange(SIZE, dtype=np.int32)
+    wk, bk, piece = index >> 12, index >> 6 & 63, index & 63
+
+    def attacks(source, target, blocker):
+        # Attack of the piece, only the strong king can block it, the weak king is the one moving or attacked
+        return lines[source, target] & ~between[source, target, blocker]
+
+    valid = (wk != bk) & (wk != piece) & (bk != piece) & ~adjacent[wk, bk]
+    if kind == PAWN: valid &= (piece >> 3 >= 1) & (piece >> 3 <= 6)
+    check = attacks(piece, bk, wk)
+    # With the strong side to move the weak king can't already be in check
+    valid_strong = valid & ~check
+
+    # Weak side: king moves, taking an unprotected piece draws
+    targets = king_targets[bk]
+    clipped = targets.clip(0)
+    capture = clipped == piece[:, None]
+    legal = (targets >= 0) & (clipped != wk[:, None]) & ~adjacent[wk[:, None], clipped] & (capture | ~attacks(piece[:, None], clipped, wk[:, None])) & valid[:, None]
+    weak_successors = np.where(legal & ~capture, wk[:, None] * 4096 + clipped * 64 + piece[:, None], -1)
+    weak_can_take = (legal & capture).any(1)
+    weak_has_move = legal.any(1)
+
+    # Strong side: king moves and piece moves, promotions point past SIZE into the promotion tables
+    columns = []
+    targets = king_targets[wk]
+    clipped = targets.clip(0)
+    legal = (targets >= 0) & (clipped != piece[:, None]) & (clipped != bk[:, None]) & ~adjacent[clipped, bk[:, None]]
+    columns.append(np.where(legal & valid_strong[:, None], clipped * 4096 + bk[:, None] * 64 + piece[:, None], -1))
+    if kind == PAWN:
+        push = (piece + 8).clip(0, 63)
+        empty = (push != wk) & (push != bk)
+        promote = push >> 3 == 7
+        successor = wk * 4096 + bk * 64 + push
+        columns.append(np.where(valid_strong & empty & ~promote, successor, -1)[:, None])
+        for offset in range(1, len(promotions or {}) + 1):
+            columns.append(np.where(valid_strong & empty & promote, offset * SIZE + successor, -1)[:, None])
+        double = (piece + 16).clip(0, 63)
+        columns.append(np.where(valid_strong & empty & (piece >> 3 == 1) & (double != wk) & (double != bk), wk * 4096 + bk * 64 + double, -1)[:, None])
+    else:
+        for d in range(rays.shape[1]):
+            blocked = np.zeros(SIZE, bool)
+            for step in range(7):
+                target = rays[piece, d, step]
+                clipped = target.clip(0)
+                blocked |= target < 0
+                blocked |= (clipped == wk) | (clipped == bk)
+                columns.append(np.where(valid_strong & ~blocked, wk * 4096 + bk * 64 + clipped, -1)[:, None])
+    strong_successors = np.concatenate(columns, 1)
+    # Only rows that can move at all take part in the iterations
+    strong_rows = np.nonzero((strong_successors >= 0).any(1))[0]
+    strong_successors = strong_successors[strong_rows]
+    weak_rows = np.nonzero(valid & weak_has_move & ~weak_can_take)[0]
+    weak_successors = weak_successors[weak_rows]
+
+    strong = np.zeros(SIZE, np.int16)
+    weak = np.zeros(SIZE, np.int16)
+    weak[valid & check & ~weak_has_move] = -1  # Checkmated, mate in 0 plies
+    external = [promotions[promoted] for promoted in promotions] if promotions else []
+
+    plies = 0
+    while True:
+        # Strong side wins in plies + 1 when one move reaches a weak position lost in plies
+        plies += 1
+        values = np.concatenate([weak, *external])
+        won = (strong_successors >= 0) & (values[strong_successors.clip(0)] == -plies)
+        won = strong_rows[won.any(1)]
+        won = won[strong[won] == 0]
+        strong[won] = plies + 1
+
+        # Weak side loses when every move reaches a strong win, the last of them was just found
+        plies += 1
+        lost = np.where(weak_successors >= 0, strong[weak_successors.clip(0)] > 0, True).all(1)
+        lost = weak_rows[lost]
+        lost = lost[weak[lost] == 0]
+        weak[lost] = -(plies + 1)
+        if not len(won) and not len(lost): break
+
+    return np.stack([strong, weak]).reshape(2, 64, 64, 64)
+
+def build(directory=TABLEBASE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    solved = {}
+    for name, kind in TABLES.items():
+        start = time.perf_counter()
+        promotions = {QUEEN: solved[QUEEN][1].reshape(-1), ROOK: solved[ROOK][1].reshape(-1)} if kind == PAWN else None
+        table = solve(kind, promotions)
+        solved[kind] = table
+        np.save(os.path.join(directory, f"{name}.npy"), table)
+        wins = int((table[0] > 0).sum())
+        print(f"{name}: {wins} wins with the strong side to move, longest mate {dtm_plies(int(table[0].max()))} plies, {time.perf_counter() - start:.1f}s")
+
+
+class Tablebases:
+    def __init__(self, directory=TABLEBASE_DIR):
+        # Only the tables that were built, each one memory-mapped
+        self.directory = directory
+        self.tables = {}
+        for name, kind in TABLES.items():
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path): self.tables[kind] = np.load(path, mmap_mode="r")
+
+    def probe(self, position: Position):
+        """ Table value for the side to move, None when the position is not covered """
+        occupied = position.occupied[WHITE] | position.occupied[BLACK]
+        count = bin(occupied).count("1")
+        if count > 3 or position.castling: return None
+        if count == 2: return DRAW
+
+        sq = lsb_square(occupied & ~(position.pieces[KING] | position.pieces[6 + KING]))
+        code = position.squares[sq]
+        kind = piece_type(code)
+        if kind in (KNIGHT, BISHOP): return DRAW
+        if kind not in self.tables: return None
+
+        strong = piece_color(code)
+        strong_king, weak_king = position.king_square(strong), position.king_square(1 - strong)
+        # Tables are for the strong side playing up the board
+        if strong == BLACK: strong_king, weak_king, sq = strong_king ^ 56, weak_king ^ 56, sq ^ 56
+        return int(self.tables[kind][0 if position.turn == strong else 1, strong_king, weak_king, sq])
+
+    def best_move(self, position: Position):
+        """ (move, value) of the best move by the tables, None when the position is not covered """
+        best = None
+        for move in position.legal_moves():
+            position.make_move(move)
+            child = self.probe(position)
+            position.unmake_move()
+            if child is None: return None
+
+            # The child is scored for the opponent
+            value = -child + (1 if child < 0 else -1 if child > 0 else 0)
+            rank = (2, -value) if value > 0 else (1, 0) if value == 0 else (0, -value)
+            if best is None or rank > best[0]: best = (rank, move, value)
+        return None if best is None else best[1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe the endgame tablebases.")
+    parser.add_argument("--dir", default=TABLEBASE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="solve KQK, KRK and KPK")
+    probe_parser = commands.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("--fen", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.dir)
+        return 0
+
+    tablebases = Tablebases(args.dir)
+    position = Position(args.fen)
+    value = tablebases.probe(position)
+    if value is None: print("Not in the tablebases")
+    elif value == DRAW: print("Draw")
+    else: print(f"{'Win' if value > 0 else 'Loss'} for the side to move, mate in {dtm_plies(value)} plies")
+    best = tablebases.best_move(position)
+    if best: print(f"Best move: {move_to_uci(best[0])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Fixed-size transposition table in one preallocated array, indexed by the position hash.
+
+Every bucket has two slots: a depth-preferred slot that only gives way to searches at least
+as deep, and an always-replace slot that takes everything else. A slot is two 64-bit words,
+the key and the packed entry (best move, depth, bound, score). The key word is stored XORed
+with the entry, so a slot torn by two processes writing at once just fails to match.
+"""
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+SLOT_WORDS = 2
+BUCKET_WORDS = 2 * SLOT_WORDS
+BUCKET_BYTES = BUCKET_WORDS * 8
+SCORE_OFFSET = 1 << 31
+
+
+def table_bytes(size_mb):
+    # Largest power of two bucket count that fits the memory cap, so the index is a mask
+    buckets = max(1, (size_mb << 20) // BUCKET_BYTES)
+    return (1 << (buckets.bit_length() - 1)) * BUCKET_BYTES
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=8, buffer=None):
+        """ buffer: optional writable memory of table_bytes(size_mb) bytes, e.g. shared memory """
+        size = table_bytes(size_mb)
+        if buffer is None: self.table = array("Q", bytes(size))
+        else: self.table = memoryview(buffer)[:size].cast("Q")
+        self.mask = size // BUCKET_BYTES - 1
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    @property
+    def size_bytes(self):
+        return len(self.table) * 8
+
+    def clear(self):
+        self.table[:] = array("Q", bytes(self.size_bytes))
+        self.hits = self.misses = self.collisions = self.stores = 0
+
+    def probe(self, key):
+        """ Returns (depth, bound, score, move) or None """
+        table = self.table
+        base = (key & self.mask) * BUCKET_WORDS
+        for slot in (base, base + SLOT_WORDS):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == key:
+                self.hits += 1
+                return data >> 16 & 0xFF, data >> 24 & 3, (data >> 26) - SCORE_OFFSET, data & 0xFFFF
+
+        # A different position already lives in this bucket
+        if table[base + 1] or table[base + SLOT_WORDS + 1]: self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        table = self.table
+        base = (key & self.mask) * BUCKET_WORDS
+        data = move | min(depth, 0xFF) << 16 | bound << 24 | (score + SCORE_OFFSET) << 26
+
+        # Depth-preferred slot first, the always-replace slot takes shallower results
+        deep = table[base + 1]
+        slot = base if not deep or table[base] ^ deep == key or depth >= (deep >> 16 & 0xFF) else base + SLOT_WORDS
+        table[slot] = key ^ data
+        table[slot + 1] = data
+        self.stores += 1
+
+    def stats(self):
+        probes = self.hits + self.misses
+        # Fill rate sampled over the first buckets, a full scan would be too slow
+        sample = min(len(self.table) // BUCKET_WORDS, 1000) * BUCKET_WORDS
+        used = sum(1 for i in range(1, sample, SLOT_WORDS) if self.table[i])
+        return {
+            "size_mb": self.size_bytes / (1 << 20),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "fill_rate": used / (sample // SLOT_WORDS) if sample else 0.0,
+        }